@@ -3,8 +3,8 @@
 
 DOC = 'Installation script for Finance Control.'''
 COPYRIGHT_YEAR = '2021'
-VERSION = '0.12'
-DATE = '2024-07-31'
+VERSION = '0.13'
+DATE = '2026-10-18'
 AUTHOR = 'António Manuel Dias <ammdias@gmail.com>'
 LICENSE = '''
 This program is free software: you can redistribute it and/or modify
@@ -24,7 +24,9 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # List of file to be copied to installation the directory
 FILES = ('finctrlcmd.py', 'finctrl.py', 'finstore.py', 'finutil.py',
-         'sqlitestore.py', 'UNINSTALL.py',
+         'sqlitestore.py', 'finanalytics.py', 'finserver.py', 'finclient.py',
+         'finrpc.py',
+         'UNINSTALL.py',
          'LICENSE.md', 'LICENSE.html', 'MANUAL.md', 'MANUAL.html',
          'README.md', 'CHANGES.md', 'food.csv.png', '__version__')
 
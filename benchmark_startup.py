@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""
+Finance Control startup benchmark
+
+Measures the time taken by one-shot runs of the program, from the start of the
+process to its end, and fails if the median is over the startup budget.
+"""
+
+__version__ = '0.13'
+__date__ = '2026-10-18'
+__author__ = 'António Manuel Dias <ammdias@gmail.com>'
+__license__ = """
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+import os.path
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+#------------------------------------------------------------------------------
+# parse command line arguments
+
+parser = argparse.ArgumentParser()
+parser.add_argument("file", type=str, nargs='?',
+                    help="file to open (a new empty file if not given).")
+parser.add_argument("-c", "--command", type=str, default="ls acc",
+                    help="command to be executed (default: 'ls acc').")
+parser.add_argument("-n", "--runs", type=int, default=20,
+                    help="number of runs (default: 20).")
+parser.add_argument("--budget", type=float, default=60,
+                    help="maximum median time of a run, in milliseconds "
+                         "(default: 60).")
+args = parser.parse_args()
+
+
+#------------------------------------------------------------------------------
+# Run benchmark
+
+program = os.path.join(sys.path[0], 'finctrl.py')
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    fname = args.file or os.path.join(tmpdir, 'bench.fin')
+    # the first run creates the file, if needed, and the compiled modules
+    cmdline = [sys.executable, program, fname, '--batch', '-c', args.command]
+    subprocess.run(cmdline, stdout=subprocess.DEVNULL)
+
+    times = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = subprocess.run(cmdline, stdout=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+        if result.returncode:
+            sys.exit(f"Command failed: {args.command}")
+
+median = statistics.median(times)
+print(f"Runs: {args.runs}")
+print(f"Minimum: {min(times):.1f} ms")
+print(f"Median: {median:.1f} ms")
+print(f"Budget: {args.budget:.1f} ms")
+
+if median > args.budget:
+    sys.exit("Startup budget exceeded.")
@@ -0,0 +1,205 @@
+"""
+Finance Control analytics: transactions and parcels loaded in column arrays
+for vectorized reports.  Requires NumPy, which is optional for the program.
+"""
+
+__version__ = '0.13'
+__date__ = '2026-10-18'
+__author__ = 'António Manuel Dias <ammdias@gmail.com>'
+__license__ = """
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+#-----------------------------------------------------------------------------
+class Analytics:
+    """Transactions and parcels of a FinStore in column arrays.
+
+       Transactions are selected with the filters of FinStore.transactions()
+       and their columns are read with one query each:
+         trans, account, day, amount, currency
+       and the columns of their parcels and parcel tags:
+         parcel, parcel_trans, parcel_amount
+         tag_parcel, tag
+       Days are date ordinals (datetime.date.toordinal()), amounts are in the
+       units of the smallest fraction of the currency, currencies are indexes
+       into the currencies list and parcel_trans and tag_parcel are indexes
+       into the transaction and parcel columns, respectively.
+    """
+
+    def __init__(self, store, acckey=None, amount=None, to_amount=None,
+                       datemin=None, datemax=None):
+        """Load the transactions selected by the filters from the store.
+        """
+        if np is None:
+            raise ValueError("Analytics require NumPy, which is not installed.")
+
+        filters = (acckey, amount, to_amount, datemin, datemax)
+
+        def column(name, dtype):
+            return np.fromiter(store.iter_column(name, *filters), dtype=dtype)
+
+        # transactions, ordered by key
+        self.trans = column('trans', np.int64)
+        self.account = column('account', np.int32)
+        self.day = column('julianday', np.int32) - _JD_ORDINAL
+        self.amount = column('amount', np.int64)
+
+        # parcels of the transactions, ordered by key
+        self.parcel = column('parcel', np.int64)
+        self.parcel_trans = np.searchsorted(self.trans,
+                                            column('parcel_trans', np.int64))
+        self.parcel_amount = column('parcel_amount', np.int64)
+
+        # tags of the parcels
+        self.tag_parcel = np.searchsorted(self.parcel,
+                                          column('tag_parcel', np.int64))
+        self.tag = column('tag', np.int32)
+
+        # names
+        accounts = store.accounts()
+        self.accounts = {a.key: a.name for a in accounts}
+        self.tags = store.tag_names()
+        self.currencies = sorted({a.currency for a in accounts})
+        index = {c: i for i, c in enumerate(self.currencies)}
+        lookup = np.zeros(max(self.accounts, default=0) + 1, dtype=np.int32)
+        for a in accounts:
+            lookup[a.key] = index[a.currency]
+        self.currency = lookup[self.account]
+
+
+    def cash_flow(self, period='month'):
+        """Return the inflow, outflow and number of transactions by period
+           and currency, as the arrays (periods, currencies, inflow, outflow,
+           count).  Period is 'day', 'week', 'month' or 'year' and periods are
+           given by their first day.
+        """
+        (periods, currencies), (inflow, outflow), count = \
+            _group((_periods(self.day, period), self.currency),
+                   np.maximum(self.amount, 0), np.minimum(self.amount, 0))
+
+        return (_dates(periods), np.array(self.currencies)[currencies],
+                inflow, outflow, count)
+
+
+    def by_account(self):
+        """Return the inflow, outflow and number of transactions by account,
+           as the arrays (account names, inflow, outflow, count).
+        """
+        (accounts,), (inflow, outflow), count = \
+            _group((self.account,),
+                   np.maximum(self.amount, 0), np.minimum(self.amount, 0))
+        names = np.array([self.accounts[a] for a in accounts.tolist()],
+                         dtype=object)
+
+        return names, inflow, outflow, count
+
+
+    def by_tag(self):
+        """Return the inflow, outflow and number of parcels by tag and
+           currency, as the arrays (tag names, currencies, inflow, outflow,
+           count).
+        """
+        amount = self.parcel_amount[self.tag_parcel]
+        currency = self.currency[self.parcel_trans[self.tag_parcel]]
+        (tags, currencies), (inflow, outflow), count = \
+            _group((self.tag, currency),
+                   np.maximum(amount, 0), np.minimum(amount, 0))
+        names = np.array([self.tags[t] for t in tags.tolist()], dtype=object)
+
+        return (names, np.array(self.currencies)[currencies],
+                inflow, outflow, count)
+
+
+    def rolling(self, days):
+        """Return the sum of the amounts of the transactions in a rolling
+           window of a number of days, for every day from the first to the
+           last transaction, as the arrays (dates, sums).
+           Amounts of all the transactions are summed, so they should be
+           loaded for accounts of a single currency.
+        """
+        if days < 1:
+            raise ValueError("The window must have one day or more.")
+        if not len(self.day):
+            return _dates(np.zeros(0, dtype=np.int64)), np.zeros(0, np.int64)
+
+        first = int(self.day.min())
+        daily = np.zeros(int(self.day.max()) - first + 1, dtype=np.int64)
+        np.add.at(daily, self.day - first, self.amount)
+        sums = np.cumsum(daily)
+        sums[days:] = sums[days:] - sums[:-days]
+
+        return _dates(np.arange(first, first + len(daily))), sums
+
+
+#-----------------------------------------------------------------------------
+# Auxiliary functions
+
+# Julian day number of the day before date ordinal 1 (0001-01-01)
+_JD_ORDINAL = 1721424
+
+# Date ordinal of the numpy datetime64 epoch (1970-01-01)
+_EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+
+def _dates(days):
+    """Return array of date ordinals as numpy dates.
+    """
+    return (days - _EPOCH).astype('datetime64[D]')
+
+
+def _periods(days, period):
+    """Return array of date ordinals as the ordinals of the first days of
+       their periods.
+    """
+    if period == 'day':
+        return days
+    if period == 'week':
+        # date ordinal 1 is a monday
+        return days - (days - 1) % 7
+    if period in ('month', 'year'):
+        unit = 'M' if period == 'month' else 'Y'
+        first = _dates(days).astype(f'datetime64[{unit}]')
+        return first.astype('datetime64[D]').astype(np.int64) + _EPOCH
+
+    raise ValueError(f"Unknown period: {period}")
+
+
+def _group(keys, *values):
+    """Group rows by the values of the key columns.
+       Return the key columns of the groups, the sums of each values column
+       by group and the number of rows of each group.
+    """
+    if not len(keys[0]):
+        empty = np.zeros(0, dtype=np.int64)
+        return tuple(empty for _ in keys), tuple(empty for _ in values), empty
+
+    groups, inverse = np.unique(np.column_stack(keys), axis=0,
+                                return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = []
+    for v in values:
+        s = np.zeros(len(groups), dtype=np.int64)
+        np.add.at(s, inverse, v)
+        sums.append(s)
+
+    return (tuple(groups.T), tuple(sums),
+            np.bincount(inverse, minlength=len(groups)))
@@ -0,0 +1,56 @@
+"""
+Finance Control client: sends commands to a Finance Control server (see the
+finserver module) through a Unix domain socket.
+"""
+
+__version__ = '0.13'
+__date__ = '2026-10-18'
+__author__ = 'António Manuel Dias <ammdias@gmail.com>'
+__license__ = """
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import json
+import socket
+
+
+#-----------------------------------------------------------------------------
+def client(sockpath, lines, fmt='tsv'):
+    """Send command lines to a server, writing their output to the standard
+       output and errors to the standard error.
+       Return 1 if any command failed, 0 otherwise.
+    """
+    status = 0
+    with socket.socket(socket.AF_UNIX) as s:
+        s.connect(os.path.expanduser(sockpath))
+        with s.makefile('rwb') as f:
+            for line in lines:
+                if not line.strip():
+                    continue
+                if line.split()[0] in ('bye', 'EOF'):
+                    break
+                f.write(json.dumps({'command': line, 'format': fmt})
+                            .encode('utf-8') + b'\n')
+                f.flush()
+                response = f.readline()
+                if not response:
+                    raise ConnectionError("The server closed the connection.")
+                response = json.loads(response)
+                sys.stdout.write(response['output'])
+                sys.stderr.write(response['errors'])
+                status |= response['status']
+
+    return status
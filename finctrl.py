@@ -6,8 +6,8 @@ Finance Control
 An application to control personal finances.
 """
 
-__version__ = '0.12'
-__date__ = '2024-07-31'
+__version__ = '0.13'
+__date__ = '2026-10-18'
 __author__ = 'António Manuel Dias <ammdias@gmail.com>'
 __license__ = """
 This program is free software: you can redistribute it and/or modify
@@ -29,7 +29,45 @@ import sys
 import os.path
 import argparse
 
-from finctrlcmd import FinCtrlCmd
+import finutil
+
+
+#------------------------------------------------------------------------------
+# Serve a file on a Unix socket or as JSON-RPC on a local host port:
+#   finctrl.py serve FILE (--socket PATH | --port PORT [--token-file PATH]
+#                                                      [--readers N])
+
+if sys.argv[1:2] == ['serve']:
+    parser = argparse.ArgumentParser(prog='finctrl.py serve',
+                description="keep a file open and run the commands sent to "
+                            "the socket, or the FinStore methods called "
+                            "with JSON-RPC on the port.")
+    parser.add_argument("file", type=str, help="file to serve.")
+    listen = parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument("--socket", type=str,
+                        help="path of the socket to listen on.")
+    listen.add_argument("--port", type=int,
+                        help="local host port to listen on for JSON-RPC "
+                             "requests.")
+    parser.add_argument("--token-file", type=str, default='~/.finctrl.token',
+                        help="file where the token of the JSON-RPC clients is "
+                             "written (default: ~/.finctrl.token).")
+    parser.add_argument("--readers", type=int, default=4,
+                        help="number of connections running JSON-RPC queries "
+                             "(default: 4).")
+    args = parser.parse_args(sys.argv[2:])
+
+    try:
+        if args.socket:
+            from finserver import serve
+            serve(args.file, args.socket)
+        else:
+            from finrpc import serve
+            serve(args.file, args.port, args.token_file, args.readers)
+    except Exception as e:
+        finutil.error(f"unable to serve the file. Reason:\n    {e}")
+        sys.exit(1)
+    sys.exit(0)
 
 
 #------------------------------------------------------------------------------
@@ -38,9 +76,26 @@ from finctrlcmd import FinCtrlCmd
 parser = argparse.ArgumentParser()
 parser.add_argument("file", type=str, nargs='?', help="file to open.")
 parser.add_argument("-s", "--source", type=str, help="file to be executed.")
+parser.add_argument("-c", "--command", type=str, action="append",
+                    help="command to be executed, without greeting "
+                         "(may be given more than once).")
+parser.add_argument("-q", "--quiet", action="store_true",
+                    help="do not print the greeting.")
+parser.add_argument("--batch", action="store_true",
+                    help="run commands from the command line, the source file "
+                         "or the standard input without greeting or "
+                         "pagination.")
+parser.add_argument("--format", choices=('tsv', 'jsonl'), default='tsv',
+                    help="format of the results in batch mode: tab separated "
+                         "values (default) or JSON lines.")
+parser.add_argument("--socket", type=str,
+                    help="send the commands to the server listening on the "
+                         "socket (see 'finctrl.py serve -h').")
 parser.add_argument("--uninstall", action="store_true",
                     help="uninstall application.")
 args = parser.parse_args()
+if args.socket and args.file:
+    parser.error("a file may not be given with --socket.")
 
 
 #------------------------------------------------------------------------------
@@ -51,18 +106,51 @@ if args.uninstall:
     from UNINSTALL import uninstall
     uninstall()
 
-# Print application greeting
-try:
-    appver = open(os.path.join(sys.path[0], '__version__')).read().strip()
-except:
-    appver = __version__
-print('Finance Control')
-print('Version:', appver)
-print('Copyright (C) 2021', __author__)
-print(__license__)
+# Send commands to a server and exit with an error status if any failed
+if args.socket:
+    from finclient import client
+    try:
+        lines = args.command or (open(args.source) if args.source
+                                 else sys.stdin)
+        status = client(args.socket, lines, args.format)
+    except Exception as e:
+        finutil.error(f"unable to send commands to the server. Reason:\n    {e}")
+        status = 1
+    sys.exit(status)
+
+# the client above doesn't need the command interpreter
+from finctrlcmd import FinCtrlCmd
 
 fincmd = FinCtrlCmd()
 
+# Run commands from the command line or in batch mode and exit with an error
+# status if any failed
+if args.command or args.batch:
+    if args.batch:
+        finutil.batch = args.format
+    finutil.paging = False
+    fincmd.preloop()
+    if args.file:
+        fincmd.do_open(args.file)
+    if args.source:
+        fincmd.do_source(args.source)
+    for line in args.command or ([] if args.source else sys.stdin):
+        line = fincmd.precmd(line)
+        if line and fincmd.onecmd(line):
+            break
+    sys.exit(1 if finutil.errors else 0)
+
+# Print application greeting
+if not args.quiet:
+    try:
+        appver = open(os.path.join(sys.path[0], '__version__')).read().strip()
+    except:
+        appver = __version__
+    print('Finance Control')
+    print('Version:', appver)
+    print('Copyright (C) 2021', __author__)
+    print(__license__)
+
 if args.source:
     fincmd.preloop()
     fincmd.do_source(args.source)
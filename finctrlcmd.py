@@ -2,8 +2,8 @@
 Finance Control command line interface
 """
 
-__version__ = '0.12'
-__date__ = '2024-07-31'
+__version__ = '0.13'
+__date__ = '2026-10-18'
 __author__ = 'António Manuel Dias <ammdias@gmail.com>'
 __license__ = """
 This program is free software: you can redistribute it and/or modify
@@ -24,9 +24,8 @@ import cmd
 import sys
 import shlex
 import os             # for os.path and os.environ
-import subprocess
-import webbrowser
 
+import finutil        # for finutil.errors
 from finutil import *
 from finstore import FinStore
 
@@ -54,6 +53,7 @@ class FinCtrlCmd(cmd.Cmd):
     prompt = DEFAULTS['prompt']
     _store = None
     echo = False
+    serving = False     # commands sent to a server, which keeps its file open
 
     #-------------------------------------------------------------------------
     # Setup and configuration methods
@@ -120,6 +120,9 @@ class FinCtrlCmd(cmd.Cmd):
         """Open a Finance Control database file:
         > open FILE
         """
+        if self._refused('open'):
+            return
+
         arg = os.path.expanduser(arg)
         try:
             if os.path.exists(arg):
@@ -143,6 +146,9 @@ class FinCtrlCmd(cmd.Cmd):
         """Close the current database file.
         > close
         """
+        if self._refused('close'):
+            return
+
         self._store = None
         self.prompt = DEFAULTS['prompt']
 
@@ -188,35 +194,45 @@ class FinCtrlCmd(cmd.Cmd):
 
     def do_source(self, arg):
         """Execute commands from a file.
-        > source [edit] FILE
+        > source [edit] [atomic] FILE
         """
         try:
             args = shlex.split(arg)
-        except Exceptions as e:
+        except Exception as e:
             error(f"Could not parse the command. Reason:\n    {e}")
             return
 
-        if 'edit' in args:
-            edit = True
+        edit, atomic = 'edit' in args, 'atomic' in args
+        if edit:
             args.remove('edit')
-        else:
-            edit = False
+        if atomic:
+            args.remove('atomic')
 
         if len(args) != 1:
             error("'source' command syntax:\n"
-                  "    > source [edit] FILE")
+                  "    > source [edit] [atomic] FILE")
+            return
+
+        if atomic and not self._store:
+            error("'source atomic' command needs an open file.")
             return
 
         fname = os.path.expanduser(args[0])
         if edit:
+            if self._refused('source edit'):
+                return
             self._editfile(fname)
 
-        echo, self.echo = self.echo, True
+        # commands are not echoed in batch mode, to keep the output clean
+        echo, self.echo = self.echo, not finutil.batch
         try:
-            for line in open(fname, 'r'):
-                line = self.precmd(line)
-                if line:
-                    self.onecmd(line)
+            if atomic:
+                self._source_atomic(fname)
+            else:
+                for line in open(fname, 'r'):
+                    line = self.precmd(line)
+                    if line:
+                        self.onecmd(line)
         except Exception as e:
             error(f"Could not read the file. Reason:\n    {e}")
         finally:
@@ -231,6 +247,8 @@ class FinCtrlCmd(cmd.Cmd):
         > set echo ON|OFF
         > set editor TEXT
         > set prompt TEXT
+        > set storage profile safe|balanced|bulk-load
+        > set storage snapshots ON|OFF
         > set transfer descr[iption] TEXT
         > set withdrawal descr[iption] TEXT
         """
@@ -310,8 +328,11 @@ class FinCtrlCmd(cmd.Cmd):
     def do_show(self, arg):
         """Show a specific record's data:
         > sh[ow] acc[ount] ACCOUNT_NAME|ACCOUNT_ID
+        > sh[ow] balances [on LIST] from DATE to DATE \\
+        :                 [every day|week|month] [tofile FILE]
         > sh[ow] curr[ency] CURR_NAME
         > sh[ow] settings|manual [inline]|copyright|license [inline]
+        > sh[ow] storage
         > sh[ow] tr[ansaction] TRANSACTION_ID
         > sh[ow] last [NUMBER]
         """
@@ -331,7 +352,8 @@ class FinCtrlCmd(cmd.Cmd):
         > list|ls curr[encies] [CURR_NAME] [tofile FILE]
         > list|ls parcels tagged LIST [from DATE] [to DATE] \\
         :                             [top NUMBER] [rev] [tofile FILE]
-        > list|ls tags [tofile FILE]
+          (tags in LIST may be patterns or TAG/* for all tags below TAG)
+        > list|ls tags [tree] [tofile FILE]
         > list|ls tr[ansactions] [on LIST] [of AMOUNT[:AMOUNT]] \\
         :                        [from DATE] [to DATE] \\
         :                        [top NUMBER] [rev] [tofile FILE]
@@ -347,9 +369,9 @@ class FinCtrlCmd(cmd.Cmd):
 
     def do_find(self, arg):
         """Find text in descriptions.
-        > find parcels like TEXT [from DATE] [to DATE] \\
+        > find parcels like TEXT|matching QUERY [from DATE] [to DATE] \\
         :                        [top NUMBER] [rev] [tofile FILE]
-        > find tr[ansactions] like TEXT [from DATE] [to DATE] \\
+        > find tr[ansactions] like TEXT|matching QUERY [from DATE] [to DATE] \\
         :                               [top NUMBER] [rev] [tofile FILE]
         """
         if self._store:
@@ -358,12 +380,28 @@ class FinCtrlCmd(cmd.Cmd):
             error("'find' command needs an open file.")
 
 
+    def do_report(self, arg):
+        """Report totals of transactions and parcels.
+        > report monthly [on LIST|tagged LIST] [from DATE] [to DATE] \\
+        :                [tofile FILE]
+        > report tags [on LIST] [from DATE] [to DATE] [tofile FILE]
+        """
+        if self._store:
+            self._dispatch('report', arg)
+        else:
+            error("'report' command needs an open file.")
+
+
     #---- Quit commands
 
     def do_bye(self, arg):
         """Quit Finance Control.
         """
-        print('Bye.')
+        if self._refused('bye'):
+            return
+
+        if not finutil.batch:
+            print('Bye.')
         return True
 
     do_EOF = do_bye
@@ -502,6 +540,24 @@ class FinCtrlCmd(cmd.Cmd):
             error(f"unable to set editor. Reason:\n    {e}")
 
 
+    def _set_storage(self, args):
+        """Set storage connection profile or daily balance snapshots.
+        """
+        if len(args) != 2 or args[0] not in ('profile', 'snapshots') or \
+                (args[0] == 'snapshots' and args[1].lower() not in ('on', 'off')):
+            raise Exception("'set storage' syntax:\n"
+                            "    > set storage profile safe|balanced|bulk-load\n"
+                            "    > set storage snapshots ON|OFF")
+
+        try:
+            if args[0] == 'profile':
+                self._store.set_profile(args[1].lower())
+            else:
+                self._store.set_snapshots(args[1].lower() == 'on')
+        except Exception as e:
+            error(f"unable to set storage {args[0]}. Reason:\n    {e}")
+
+
     def _set_withdrawal(self, args):
         """Set withdrawal default text.
         """
@@ -579,7 +635,7 @@ class FinCtrlCmd(cmd.Cmd):
 
         t = self._addtr(kw, descr=self._store.metadata('deposit'), mul=1)
         if t:
-            print(f"Transaction id: {t}")
+            self._print_ids(t)
 
 
     def _add_withdrawal(self, args):
@@ -594,7 +650,7 @@ class FinCtrlCmd(cmd.Cmd):
 
         t = self._addtr(kw, descr=self._store.metadata('withdrawal'), mul=-1)
         if t:
-            print(f"Transaction id: {t}")
+            self._print_ids(t)
 
 
     def _add_transfer(self, args):
@@ -625,7 +681,7 @@ class FinCtrlCmd(cmd.Cmd):
                 error(f"unable to delete transaction. Reason:\n    {e}")
         else:
             if t1 and t2:
-                print(f"Transaction ids: {t1}, {t2}")
+                self._print_ids(t1, t2)
 
 
     def _add_transaction(self, args):
@@ -651,7 +707,7 @@ class FinCtrlCmd(cmd.Cmd):
 
         t = self._addtr(kw, parcels=parcels, mul=mul)
         if t:
-            print(f"Transaction id: {t}")
+            self._print_ids(t)
 
     # shortcut
     _add_tr = _add_transaction
@@ -901,7 +957,8 @@ class FinCtrlCmd(cmd.Cmd):
                 paginate(data=data)
             except Exception as e:
                 raise Exception(f"Could not read file. Reason:\n    {e}")
-        else:
+        elif not self._refused('show manual'):
+            import webbrowser
             webbrowser.open_new(os.path.join(sys.path[0], 'MANUAL.html'))
             print("The program's manual should be displayed in your browser.")
             print("If this doesn't happen, please use the command:\n"
@@ -933,7 +990,8 @@ class FinCtrlCmd(cmd.Cmd):
                 paginate(data=data)
             except Exception as e:
                 raise Exception(f"Could not read file. Reason:\n    {e}")
-        else:
+        elif not self._refused('show license'):
+            import webbrowser
             webbrowser.open_new(os.path.join(sys.path[0], 'LICENSE.html'))
             print("The program's manual should be displayed in your browser.")
             print("If this doesn't happen, please use the command:\n"
@@ -948,18 +1006,36 @@ class FinCtrlCmd(cmd.Cmd):
                             "    > sh[ow] settings")
         try:
             data = []
-            data.append(f"Prompt: {self._store.metadata('prompt')}")
-            data.append(f"Field separator for CSV files: {self._store.metadata('csvsep')}")
-            data.append(f"Configured editor: {self._store.metadata('editor')}")
-            data.append(f"Default deposit text: {self._store.metadata('deposit')}")
-            data.append(f"Default withdrawal text: {self._store.metadata('withdrawal')}")
-            data.append(f"Default transfer text: {self._store.metadata('transfer')}")
-            data.append(f"Default currency: {self._store.metadata('currency')}")
-            paginate(data=data)
+            data.append(("Prompt", self._store.metadata('prompt')))
+            data.append(("Field separator for CSV files", self._store.metadata('csvsep')))
+            data.append(("Configured editor", self._store.metadata('editor')))
+            data.append(("Default deposit text", self._store.metadata('deposit')))
+            data.append(("Default withdrawal text", self._store.metadata('withdrawal')))
+            data.append(("Default transfer text", self._store.metadata('transfer')))
+            data.append(("Default currency", self._store.metadata('currency')))
+            print_fields(data)
         except Exception as e:
             error(f"unable to show settings. Reason:\n    {e}")
 
 
+    def _show_storage(self, args):
+        """Show storage profile and connection settings.
+        """
+        if args:
+            raise Exception("'show storage' syntax:\n"
+                            "    > sh[ow] storage")
+        try:
+            data = []
+            data.append(("Profile", self._store.profile()))
+            data.append(("Schema version", self._store.metadata('schema_version')))
+            data.append(("Daily balance snapshots",
+                         'on' if self._store.snapshots() else 'off'))
+            data.extend(self._store.storage_info())
+            print_fields(data)
+        except Exception as e:
+            error(f"unable to show storage settings. Reason:\n    {e}")
+
+
     def _show_currency(self, args):
         """Show currency.
         """
@@ -969,13 +1045,13 @@ class FinCtrlCmd(cmd.Cmd):
         try:
             curr = self._store.currency(args[0])
             data = []
-            data.append(f"Name: {curr.name}")
-            data.append(f"Short name: {curr.short_name}")
-            data.append(f"Symbol: {curr.symbol}")
-            data.append(f"Symbol position: {curr.symbol_pos}")
-            data.append(f"Decimal places: {curr.dec_places}")
-            data.append(f"Decimal separator: {curr.dec_sep}")
-            paginate(data=data)
+            data.append(("Name", curr.name))
+            data.append(("Short name", curr.short_name))
+            data.append(("Symbol", curr.symbol))
+            data.append(("Symbol position", curr.symbol_pos))
+            data.append(("Decimal places", curr.dec_places))
+            data.append(("Decimal separator", curr.dec_sep))
+            print_fields(data)
         except Exception as e:
             error(f"unable to show currency. Reason:\n    {e}")
 
@@ -999,12 +1075,17 @@ class FinCtrlCmd(cmd.Cmd):
             else:
                 currbal = '---'
             data = []
-            data.append(f"Account ID: {acc.key}")
-            data.append(f"Name: {acc.name}")
-            data.append(f"Description: {acc.descr}")
-            data.append(f"Currency: {curr.name}")
-            data.append(f"Balance (current): {i2d(acc.balance, curr)} ({currbal})")
-            paginate(data=data)
+            data.append(("Account ID", acc.key))
+            data.append(("Name", acc.name))
+            data.append(("Description", acc.descr))
+            data.append(("Currency", curr.name))
+            if finutil.batch:
+                data.append(("Balance", i2d(acc.balance, curr)))
+                data.append(("Current balance", currbal))
+            else:
+                data.append(("Balance (current)",
+                             f"{i2d(acc.balance, curr)} ({currbal})"))
+            print_fields(data)
         except Exception as e:
             error(f"unable to show account information. Reason:\n    {e}")
 
@@ -1012,6 +1093,40 @@ class FinCtrlCmd(cmd.Cmd):
     _show_acc = _show_account
 
 
+    def _show_balances(self, args):
+        """Show balances of accounts at the end of each day, week or month.
+        """
+        pos, kw, mkw = parse_args(args, 'on', 'from', 'to', 'every', 'tofile')
+        if pos or mkw or 'from' not in kw or 'to' not in kw or \
+                kw.get('every', 'month') not in ('day', 'week', 'month'):
+            raise Exception("'show balances' syntax:\n"
+                  "    > sh[ow] balances [on LIST] from DATE to DATE \\\n"
+                  "    :                 [every day|week|month] [tofile FILE]")
+        try:
+            accounts = {a.key: a for a in self._store.accounts()}
+            acckeys = self._account_keys(kw['on']) if 'on' in kw \
+                      else sorted(accounts)
+            datemin, datemax = parse_date(kw['from']), parse_date(kw['to'])
+            if datemin > datemax:
+                datemin, datemax = datemax, datemin
+            formats = {c.name: currency_format(c)
+                       for c in self._store.currencies()}
+            formats = [formats[accounts[a].currency].format for a in acckeys]
+            data = []
+            for date, balances in self._store.balance_series(
+                    acckeys, datemin, datemax, kw.get('every', 'month')):
+                data.append((date, *(f(b) for f, b in zip(formats, balances))))
+        except Exception as e:
+            error(f"unable to show balances. Reason:\n    {e}")
+            return
+
+        headers = ['Date', *(accounts[a].name for a in acckeys)]
+        if 'tofile' in kw:
+            export(os.path.expanduser(kw['tofile']), self.csvsep, data, headers)
+        else:
+            print_table(data, headers, hints='<' + '>' * len(acckeys))
+
+
     def _show_transaction(self, args):
         """Show transaction.
         """
@@ -1117,30 +1232,14 @@ class FinCtrlCmd(cmd.Cmd):
             if datemin and datemax and datemin > datemax:
                 datemin, datemax = datemax, datemin
 
-            transactions = self._store.transactions(acckeys, amount, to_amount,
-                                                    datemin, datemax, limit)
-            data = []
-            totals = {}
-            for t in transactions:
-                acc = self._store.transaction_account(t.key)
-                curr = self._store.transaction_currency(t.key)
-                data.append([acc.name, str(t.key), t.date, t.descr,
-                             i2d(t.amount, curr), i2d(t.accbalance, curr)])
-                totals[curr.name] = totals.get(curr.name, 0) + t.amount
+            filters = dict(acckey=acckeys, amount=amount, to_amount=to_amount,
+                           datemin=datemin, datemax=datemax)
+            totals = self._store.transaction_totals(limit=limit, **filters)
         except Exception as e:
             error(f"unable to list transactions. Reason:\n    {e}")
             return
 
-        if rev:
-            data.reverse()
-
-        headers = ['Account', 'Id', 'Date', 'Description',
-                           'Total amount', 'Account balance']
-        if 'tofile' in kw:
-            export(os.path.expanduser(kw['tofile']), self.csvsep, data, headers)
-        else:
-            print_table(data, headers, hints='<>><>>')
-            self._totals(totals, 'Total amounts by currency')
+        self._print_transactions(filters, totals, limit, rev, kw.get('tofile'))
 
     # shortcut
     _list_tr = _list_transactions
@@ -1169,13 +1268,13 @@ class FinCtrlCmd(cmd.Cmd):
         data = []
         totals = {}
         try:
+            formats = {c.name: currency_format(c)
+                       for c in self._store.currencies()}
             for i in self._store.parcels_by_tag(parse_tags(kw['tagged']),
                                                 datemin, datemax, limit):
-                acc = self._store.transaction_account(i[2])
-                curr = self._store.transaction_currency(i[2])
-                data.append((str(i[0]), i[1], acc.name, str(i[2]),
-                             i[3], i2d(i[4], curr)))
-                totals[curr.name] = totals.get(curr.name, 0) + i[4]
+                data.append((str(i[0]), i[1], i[5], str(i[2]),
+                             i[3], formats[i[6]].format(i[4])))
+                totals[i[6]] = totals.get(i[6], 0) + i[4]
         except Exception as e:
             error(f"unable to list parcels by tag. Reason:\n    {e}")
 
@@ -1194,9 +1293,12 @@ class FinCtrlCmd(cmd.Cmd):
         """List tags.
         """
         pos, kw, mkw = parse_args(args, 'tofile')
+        if pos == ['tree']:
+            self._list_tags_tree(kw.get('tofile'))
+            return
         if pos or mkw:
             raise Exception("'list tags' syntax:\n"
-                            "    > list|ls tags [tofile FILE]")
+                            "    > list|ls tags [tree] [tofile FILE]")
         try:
             data = [(t[0],str(t[1])) for t in self._store.taglist()]
         except Exception as e:
@@ -1209,18 +1311,49 @@ class FinCtrlCmd(cmd.Cmd):
             print_table(data, headers, hints='<>')
 
 
+    def _list_tags_tree(self, fname):
+        """List the tag hierarchy with the parcel totals of each node.
+        """
+        try:
+            formats = {c.name: currency_format(c)
+                       for c in self._store.currencies()}
+            data, node = [], None
+            for t in self._store.tag_tree():
+                # exports and batch mode show full paths, as they
+                # don't keep the indentation
+                if fname or finutil.batch:
+                    name = t[0]
+                elif t[0] == node:
+                    name = ''
+                else:
+                    name = '  ' * t[0].count('/') + t[0].rsplit('/', 1)[-1]
+                node = t[0]
+                data.append((name, str(t[2]), formats[t[1]].format(t[3])))
+        except Exception as e:
+            error(f"unable to list tags. Reason:\n    {e}")
+            return
+
+        headers = ['Tag', 'Parcels', 'Total amount']
+        if fname:
+            export(os.path.expanduser(fname), self.csvsep, data, headers)
+        else:
+            print_table(data, headers, hints='<>>')
+
+
     def _find_transactions(self, args):
         """Find transactions by text in their discription.
         """
-        pos, kw, mkw = parse_args(args, 'like', 'from', 'to', 'top', 'tofile')
+        pos, kw, mkw = parse_args(args, 'like', 'matching', 'from', 'to',
+                                        'top', 'tofile')
         rev = 'rev' in pos
         if rev:
             pos.remove('rev')
 
-        if pos or mkw:
+        if pos or mkw or ('like' in kw) == ('matching' in kw):
             raise Exception("'find transactions' syntax:\n"
-                  "    > find tr[ransactions] like TEXT [from DATE] [to DATE] \\\n"
-                  "    :                                [top NUMBER] [rev] [tofile FILE]")
+                  "    > find tr[ransactions] like TEXT|matching QUERY \\\n"
+                  "    :                      [from DATE] [to DATE] \\\n"
+                  "    :                      [top NUMBER] [rev] [tofile FILE]")
 
         try:
             datemin = parse_date(kw['from']) if 'from' in kw else None
@@ -1228,30 +1361,15 @@ class FinCtrlCmd(cmd.Cmd):
             if datemin and datemax and datemin > datemax:
                 datemin, datemax = datemax, datemin
             limit = parse_number(kw['top']) if 'top' in kw else None
-            transactions = \
-                self._store.transactions_by_descr(kw['like'], datemin, datemax, limit)
-            data = []
-            totals = {}
-            for t in transactions:
-                acc = self._store.transaction_account(t.key)
-                curr = self._store.transaction_currency(t.key)
-                data.append([acc.name, str(t.key), t.date, t.descr,
-                             i2d(t.amount, curr), i2d(t.accbalance, curr)])
-                totals[curr.name] = totals.get(curr.name, 0) + t.amount
+            filters = dict(datemin=datemin, datemax=datemax,
+                           pattern=kw.get('like', kw.get('matching')),
+                           fulltext='matching' in kw)
+            totals = self._store.transaction_totals(limit=limit, **filters)
         except Exception as e:
             error(f"unable to find transactions. Reason:\n    {e}")
             return
 
-        if rev:
-            data.reverse()
-
-        headers = ['Account', 'Id', 'Date', 'Description',
-                           'Total amount', 'Account balance']
-        if 'tofile' in kw:
-            export(os.path.expanduser(kw['tofile']), self.csvsep, data, headers)
-        else:
-            print_table(data, headers, hints='<>><>>')
-            self._totals(totals, 'Total amounts by currency')
+        self._print_transactions(filters, totals, limit, rev, kw.get('tofile'))
 
     _find_tr = _find_transactions
 
@@ -1259,15 +1377,17 @@ class FinCtrlCmd(cmd.Cmd):
     def _find_parcels(self, args):
         """Find parcels by text in their discription.
         """
-        pos, kw, mkw = parse_args(args, 'like', 'from', 'to', 'top', 'tofile')
+        pos, kw, mkw = parse_args(args, 'like', 'matching', 'from', 'to',
+                                        'top', 'tofile')
         rev = 'rev' in pos
         if rev:
             pos.remove('rev')
 
-        if pos or mkw:
+        if pos or mkw or ('like' in kw) == ('matching' in kw):
             raise Exception("'find parcels' syntax:\n"
-                  "    > find parcels like TEXT [from DATE] [to DATE] \\\n"
-                  "    :                        [top NUMBER] [rev] [tofile FILE]")
+                  "    > find parcels like TEXT|matching QUERY \\\n"
+                  "    :              [from DATE] [to DATE] \\\n"
+                  "    :              [top NUMBER] [rev] [tofile FILE]")
 
         datemin = parse_date(kw.get('from')) if 'from' in kw else None
         datemax = parse_date(kw.get('to')) if 'to' in kw else None
@@ -1277,12 +1397,15 @@ class FinCtrlCmd(cmd.Cmd):
         data = []
         totals = {}
         try:
-            for i in self._store.parcels_by_descr(kw['like'], datemin, datemax, limit):
-                acc = self._store.transaction_account(i[2])
-                curr = self._store.transaction_currency(i[2])
-                data.append((str(i[0]), i[1], acc.name, str(i[2]),
-                             i[3], i2d(i[4], curr)))
-                totals[curr.name] = totals.get(curr.name, 0) + i[4]
+            formats = {c.name: currency_format(c)
+                       for c in self._store.currencies()}
+            for i in self._store.parcels_by_descr(kw.get('like',
+                                                         kw.get('matching')),
+                                                  datemin, datemax, limit,
+                                                  'matching' in kw):
+                data.append((str(i[0]), i[1], i[5], str(i[2]),
+                             i[3], formats[i[6]].format(i[4])))
+                totals[i[6]] = totals.get(i[6], 0) + i[4]
         except Exception as e:
             error(f"unable to list parcels by description. Reason:\n    {e}")
 
@@ -1297,9 +1420,91 @@ class FinCtrlCmd(cmd.Cmd):
             self._totals(totals, 'Total amounts by currency')
 
 
+    def _report_monthly(self, args):
+        """Report monthly inflow, outflow and count of transactions by
+           account, or of parcels by tag.
+        """
+        pos, kw, mkw = parse_args(args, 'on', 'tagged', 'from', 'to', 'tofile')
+        if pos or mkw or ('on' in kw and 'tagged' in kw):
+            raise Exception("'report monthly' syntax:\n"
+                  "    > report monthly [on LIST|tagged LIST] [from DATE] [to DATE] \\\n"
+                  "    :                [tofile FILE]")
+        try:
+            monthmin = parse_date(kw['from'])[:7] if 'from' in kw else None
+            monthmax = parse_date(kw['to'])[:7] if 'to' in kw else None
+            if monthmin and monthmax and monthmin > monthmax:
+                monthmin, monthmax = monthmax, monthmin
+            if 'tagged' in kw:
+                rows = self._store.monthly_by_tag(parse_tags(kw['tagged']),
+                                                  monthmin, monthmax)
+            else:
+                acckeys = self._account_keys(kw['on']) if 'on' in kw else None
+                rows = self._store.monthly_by_account(acckeys,
+                                                      monthmin, monthmax)
+            formats = {c.name: currency_format(c)
+                       for c in self._store.currencies()}
+            data = []
+            for month, name, curr, inflow, outflow, count in rows:
+                data.append((month, name,
+                             *formats[curr].format_many((inflow, outflow,
+                                                         inflow + outflow)),
+                             str(count)))
+        except Exception as e:
+            error(f"unable to report monthly totals. Reason:\n    {e}")
+            return
+
+        headers = ['Month', 'Tag' if 'tagged' in kw else 'Account',
+                   'Inflow', 'Outflow', 'Net amount', 'Count']
+        if 'tofile' in kw:
+            export(os.path.expanduser(kw['tofile']), self.csvsep, data, headers)
+        else:
+            print_table(data, headers, hints='<<>>>>')
+
+
+    def _report_tags(self, args):
+        """Report number, total and average amount of parcels by tag.
+        """
+        pos, kw, mkw = parse_args(args, 'on', 'from', 'to', 'tofile')
+        if pos or mkw:
+            raise Exception("'report tags' syntax:\n"
+                  "    > report tags [on LIST] [from DATE] [to DATE] [tofile FILE]")
+        try:
+            acckeys = self._account_keys(kw['on']) if 'on' in kw else None
+            datemin = parse_date(kw['from']) if 'from' in kw else None
+            datemax = parse_date(kw['to']) if 'to' in kw else None
+            if datemin and datemax and datemin > datemax:
+                datemin, datemax = datemax, datemin
+            formats = {c.name: currency_format(c)
+                       for c in self._store.currencies()}
+            data = []
+            for tag, curr, count, total, average in \
+                    self._store.tag_totals(acckeys, datemin, datemax):
+                data.append((tag, str(count),
+                             *formats[curr].format_many((total, average))))
+        except Exception as e:
+            error(f"unable to report tag totals. Reason:\n    {e}")
+            return
+
+        headers = ['Tag', 'Parcels', 'Total amount', 'Average amount']
+        if 'tofile' in kw:
+            export(os.path.expanduser(kw['tofile']), self.csvsep, data, headers)
+        else:
+            print_table(data, headers, hints='<>>>')
+
+
     #-------------------------------------------------------------------------
     # Auxilliary methods
 
+    def _refused(self, command):
+        """Check if a command is refused by the server, which must keep its
+           file open and can't start programs on its host, and print an
+           error if it is.
+        """
+        if self.serving:
+            error(f"'{command}' command is not available in the server.")
+        return self.serving
+
+
     def _editfile(self, fname):
         """Edit a file in an external editor.
         """
@@ -1308,6 +1513,7 @@ class FinCtrlCmd(cmd.Cmd):
             editor = os.environ.get('VISUAL', os.environ.get('EDITOR', ''))
 
         if editor:
+            import subprocess
             try:
                 subprocess.call([editor, fname])
             except Exception as e:
@@ -1317,6 +1523,28 @@ class FinCtrlCmd(cmd.Cmd):
                   "Please choose an editor with the command 'set editor'.")
 
 
+    def _source_atomic(self, fname):
+        """Execute commands from a file in a single database transaction,
+           updating balances only at the end.
+           All changes are rolled back on the first error.
+        """
+        lines = open(fname, 'r').readlines()
+        store, sthist, errors = self._store, self._sthist[:], finutil.errors
+        try:
+            with store.batch():
+                for num, line in enumerate(lines, 1):
+                    line = self.precmd(line)
+                    if line:
+                        self.onecmd(line)
+                    if self._store is not store:
+                        raise Exception(f"file changed on line {num}.")
+                    if finutil.errors != errors:
+                        raise Exception(f"error on line {num}.")
+        except Exception as e:
+            self._sthist = sthist
+            error(f"all changes were rolled back. Reason:\n    {e}")
+
+
     def _setdescr(self, cmd, args):
         """Set deposit, withdrawal or transfer description.
         """
@@ -1335,9 +1563,10 @@ class FinCtrlCmd(cmd.Cmd):
         """
         t = FinStore.Transaction()
         try:
-            acc = self._store.account(self._store.account_key(kw['on']))
-            curr = self._store.account_currency(acc.key)
-            t.account = acc.key
+            # key and currency lookups don't apply the balance changes
+            # deferred by 'source atomic'
+            t.account = self._store.account_key(kw['on'])
+            curr = self._store.account_currency(t.account)
             t.descr = kw.get('descr', kw.get('description', descr))
             t.date = parse_date(kw.get('date', 'today'))
             if not parcels:
@@ -1347,18 +1576,21 @@ class FinCtrlCmd(cmd.Cmd):
                 p.tags = parse_tags(kw.get('tags', ''))
                 plist = [p]
             else:
-                plist = []
+                plist, amounts = [], []
                 for args in parcels:
                     args = shlex.split(args)
                     ppos, pkw, pmkw = parse_args(args, 'tags')
                     p = FinStore.Parcel()
                     if len(ppos) == 2 and not pmkw:
                         p.descr = ppos[0]
-                        p.amount = d2i(ppos[1], curr) * mul
+                        amounts.append(ppos[1])
                         p.tags = parse_tags(pkw.get('tags', ''))
                     else:
                         raise ValueError(f"unable to parse parcel: {args}")
                     plist.append(p)
+                for p, amount in zip(plist,
+                                     currency_format(curr).parse_many(amounts)):
+                    p.amount = amount * mul
             t.parcels = plist
             self._store.add_transaction(t)
             self._addhist(t.key)
@@ -1367,6 +1599,19 @@ class FinCtrlCmd(cmd.Cmd):
             error(f"unable to add transaction. Reason:\n    {e}")
 
 
+    def _print_ids(self, *keys):
+        """Print the ids of added transactions.
+           In batch mode they are written as a table, so that the output is
+           still in the batch mode format.
+        """
+        if finutil.batch:
+            print_table([[str(k)] for k in keys], ['ID'])
+        elif len(keys) == 1:
+            print(f"Transaction id: {keys[0]}")
+        else:
+            print(f"Transaction ids: {', '.join(str(k) for k in keys)}")
+
+
     def _addhist(self, key):
         """Add a transaction to the session transation history.
         """
@@ -1391,6 +1636,17 @@ class FinCtrlCmd(cmd.Cmd):
             t = self._store.transaction(key)
             acc = self._store.transaction_account(t.key)
             curr = self._store.transaction_currency(t.key)
+            if finutil.batch:
+                # one row for each parcel, with the transaction fields
+                print_table([[str(t.key), acc.name, str(acc.key), t.descr,
+                              i2d(t.amount, curr), t.date, str(p.key),
+                              p.descr, i2d(p.amount, curr), ', '.join(p.tags)]
+                             for p in t.parcels],
+                            ['ID', 'Account', 'Account ID', 'Description',
+                             'Total amount', 'Date', 'Parcel ID',
+                             'Parcel description', 'Amount', 'Tags'])
+                return
+
             data= []
             data.append(f"Account: {acc.name} (id: {acc.key})")
             data.append(f"Description: {t.descr}")
@@ -1406,9 +1662,87 @@ class FinCtrlCmd(cmd.Cmd):
             error(f"unable to show transaction. Reason:\n    {e}")
 
     
+    def _print_transactions(self, filters, totals, limit, rev, fname):
+        """Print or export a listing of transactions, given the filters of
+           FinStore.transaction_list() and the totals of the listing.
+           Printed listings read one page of transactions at a time.
+        """
+        headers = ['Account', 'Id', 'Date', 'Description',
+                           'Total amount', 'Account balance']
+        if fname:
+            rows = self._store.iter_transaction_list(
+                        limit=limit, after=self._listing_start(filters, limit, rev),
+                        rev=rev, **filters)
+            export(os.path.expanduser(fname), self.csvsep,
+                   (self._transaction_row(*t) for t in rows), headers)
+        else:
+            print_table([], headers, hints='<>><>>',
+                        fetch=self._transaction_pages(filters, limit, rev),
+                        count=sum(t[1] for t in totals))
+            self._totals({t[0]: t[2] for t in totals},
+                         'Total amounts by currency')
+
+
+    def _transaction_pages(self, filters, limit, rev):
+        """Return function reading a page of a transaction listing as table
+           rows, given the filters of FinStore.transaction_list().
+           Pages are read with keyset pagination, from the last transaction of
+           the previous page, or skipping the pages in between from the
+           nearest page already read.
+        """
+        # last (date, key) before each page read
+        after = {0: self._listing_start(filters, limit, rev)}
+
+        def fetch(page, size):
+            known = max(p for p in after if p <= page)
+            rows = self._store.transaction_list(
+                        limit=min(size, limit - page*size) if limit else size,
+                        after=after[known], offset=(page - known) * size,
+                        rev=rev, **filters)
+            if rows:
+                after[page + 1] = (rows[-1][0].date, rows[-1][0].key)
+            return self._transaction_rows(rows)
+
+        return fetch
+
+
+    def _listing_start(self, filters, limit, rev):
+        """Return the (date, key) of the transaction before the first one of
+           a transaction listing, or None if the listing starts at the first.
+        """
+        if not (rev and limit):
+            return None
+        # in reverse order, the listing starts after the transaction before
+        # the top ones
+        t = self._store.transaction_list(limit=1, offset=limit, **filters)
+
+        return (t[0][0].date, t[0][0].key) if t else None
+
+
+    def _transaction_row(self, t, accname, curr):
+        """Return table row of a transaction, as returned by
+           FinStore.transaction_list().
+        """
+        return [accname, str(t.key), t.date, t.descr,
+                *currency_format(curr).format_many((t.amount, t.accbalance))]
+
+
+    def _transaction_rows(self, transactions):
+        """Return table rows of a transaction list, as returned by
+           FinStore.transaction_list().
+        """
+        return [self._transaction_row(t, accname, curr)
+                for t, accname, curr in transactions]
+
+
     def _totals(self, totals, title):
         """Print list of totals by currency.
+           Totals are not printed in batch mode, where the output is only the
+           table rows.
         """
+        if finutil.batch:
+            return
+
         print(f'{title}:')
         for curr in totals:
             print(f'    {curr}: {i2d(totals[curr], self._store.currency(curr))}')
@@ -1419,7 +1753,8 @@ class FinCtrlCmd(cmd.Cmd):
         """Return the common currency of a list of accounts.
         """
         if acclist:
-            currencies = [ self._store.account(a).currency for a in acclist ]
+            currencies = [ self._store.account_currency(a).name
+                           for a in acclist ]
         else:
             currencies = [ a.currency for a in self._store.accounts() ]
 
@@ -0,0 +1,415 @@
+"""
+Finance Control JSON-RPC server: exposes the query and change methods of the
+FinStore class of a Finance Control file as JSON-RPC 2.0 over TCP, on the
+local host only.
+
+Requests and responses are single lines of JSON.  The first request of a
+connection must call the 'authenticate' method with the token the server
+writes, when it starts, to a file only its user may read:
+    {"jsonrpc": "2.0", "id": 0, "method": "authenticate", "params": [TOKEN]}
+and then the connection may send new requests before receiving the responses
+of the previous ones, which are sent as they are ready.  For example:
+    {"jsonrpc": "2.0", "id": 1, "method": "account_balance",
+     "params": [1, "2026-10-18"]}
+    {"jsonrpc": "2.0", "id": 1, "result": 16000}
+Queries are run by a pool of threads, each with its own read-only connection
+to the file, and changes are run one at a time, in the order they arrive, by
+a single writer thread.  Amounts are integers in the units of the smallest
+fraction of the currency and the currency, account, transaction and parcel
+objects are JSON objects with the attributes of the FinStore classes.
+"""
+
+__version__ = '0.13'
+__date__ = '2026-10-18'
+__author__ = 'António Manuel Dias <ammdias@gmail.com>'
+__license__ = """
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import json
+import queue
+import signal
+import sqlite3
+import asyncio
+import inspect
+import secrets
+import datetime
+import threading
+import contextlib
+import concurrent.futures
+
+from finstore import FinStore
+
+
+#-----------------------------------------------------------------------------
+class RPCServer:
+    """JSON-RPC server of a Finance Control file.
+    """
+
+    def __init__(self, fname, token, readers=4):
+        """Open the file in the writer thread, upgrading it if needed, and
+           then in each of the reader threads.  Connections are accepted
+           only from clients sending the token.
+        """
+        if readers < 1:
+            raise ValueError("The server needs one reader or more.")
+
+        self._token = token
+        self._reads = queue.Queue()
+        self._writes = queue.Queue()
+        self._workers = []
+        try:
+            for calls, readonly in ([(self._writes, False)] +
+                                    [(self._reads, True)] * readers):
+                worker = _Worker(fname, calls, readonly)
+                self._workers.append(worker)
+                worker.start()
+                worker.ready.result()
+        except:
+            self.close()
+            raise
+
+
+    def close(self):
+        """Stop the worker threads, closing their connections.
+        """
+        for worker in self._workers:
+            worker.calls.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+
+    async def serve(self, port):
+        """Listen on the local host port until cancelled.
+        """
+        server = await asyncio.start_server(self._handle, '127.0.0.1', port,
+                                            limit=_MAX_REQUEST)
+        async with server:
+            print(f"Serving on 127.0.0.1:{port}.", file=sys.stderr)
+            await server.serve_forever()
+
+
+    async def call(self, method, params):
+        """Run a method in the reader or writer threads and return its result
+           encoded in JSON.
+        """
+        if method in _READS:
+            calls = self._reads
+        elif method in _WRITES:
+            calls = self._writes
+        else:
+            raise _RPCError(_METHOD_NOT_FOUND, f"Method not found: {method}")
+        if not isinstance(params, (list, dict)):
+            raise _RPCError(_INVALID_PARAMS, "Params must be a list or an "
+                                             "object.")
+
+        future = concurrent.futures.Future()
+        calls.put((future, method, params))
+        return await asyncio.wrap_future(future)
+
+
+    async def respond(self, request):
+        """Run a decoded request, or batch of requests, and return the
+           response encoded in JSON, or None for notifications.
+        """
+        if isinstance(request, list) and request:
+            responses = [r for r in await asyncio.gather(
+                             *(self.respond(r) for r in request)) if r]
+            return f"[{', '.join(responses)}]" if responses else None
+
+        if (not isinstance(request, dict)
+                or request.get('jsonrpc') != '2.0'
+                or not isinstance(request.get('method'), str)):
+            return _response(None, error=_RPCError(_INVALID_REQUEST,
+                                                   "Invalid request."))
+
+        # requests without id are notifications, which get no response
+        rid = request.get('id')
+        try:
+            result = await self.call(request['method'],
+                                     request.get('params', []))
+            response = _response(rid, result=result)
+        except _RPCError as e:
+            response = _response(rid, error=e)
+        except (ValueError, sqlite3.Error) as e:
+            response = _response(rid, error=_RPCError(_STORE_ERROR, str(e)))
+        except Exception as e:
+            response = _response(rid, error=_RPCError(_INTERNAL_ERROR, str(e)))
+        return response if 'id' in request else None
+
+
+    async def _handle(self, reader, writer):
+        """Handle a connection: run each request line as it arrives and
+           write the response lines as they are ready.
+        """
+        async def respond(line):
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = _response(None, error=_RPCError(_PARSE_ERROR,
+                                                            str(e)))
+            else:
+                response = await self.respond(request)
+            if response:
+                writer.write(response.encode('utf-8') + b'\n')
+                with contextlib.suppress(ConnectionError):
+                    await writer.drain()
+
+        tasks = set()
+        try:
+            if not await self._authenticate(reader, writer):
+                return
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except (ValueError, ConnectionError):
+            # request line too long or connection lost
+            pass
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
+            writer.close()
+
+
+    async def _authenticate(self, reader, writer):
+        """Read the first request of a connection, which must call the
+           'authenticate' method with the token, and write its response.
+           Return True if the token is right.
+        """
+        rid, token = None, None
+        try:
+            request = json.loads(await reader.readline())
+            rid = request.get('id')
+            if request.get('method') == 'authenticate':
+                params = request.get('params')
+                token = (params.get('token') if isinstance(params, dict)
+                         else params[0])
+        except (ValueError, AttributeError, TypeError, IndexError):
+            pass
+
+        valid = (isinstance(token, str) and
+                 secrets.compare_digest(token.encode('utf-8'),
+                                        self._token.encode('utf-8')))
+        if valid:
+            response = _response(rid, result='true')
+        else:
+            response = _response(rid, error=_RPCError(_AUTH_ERROR,
+                                                      "Authentication failed."))
+        writer.write(response.encode('utf-8') + b'\n')
+        await writer.drain()
+        return valid
+
+
+class _Worker(threading.Thread):
+    """Thread with its own connection to the file, running the calls taken
+       from a queue until it takes None.
+    """
+
+    def __init__(self, fname, calls, readonly):
+        threading.Thread.__init__(self, daemon=True)
+        self.fname = fname
+        self.calls = calls
+        self.readonly = readonly
+        self.ready = concurrent.futures.Future()
+
+
+    def run(self):
+        try:
+            store = FinStore(self.fname, readonly=self.readonly)
+        except Exception as e:
+            self.ready.set_exception(e)
+            return
+        self.ready.set_result(None)
+
+        # the connection must be closed in this thread: it may still be
+        # referenced by the tracebacks of the errors sent to the clients
+        try:
+            while (call := self.calls.get()) is not None:
+                future, method, params = call
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(_call(store, method, params))
+                    except Exception as e:
+                        future.set_exception(e)
+        finally:
+            store.close()
+
+
+#-----------------------------------------------------------------------------
+# Methods and their arguments
+
+# FinStore methods that only query the file
+_READS = {
+    'currency', 'currencies', 'account', 'accounts', 'account_key',
+    'account_currency', 'account_balance', 'balance_series', 'snapshots',
+    'transaction', 'transactions', 'transactions_by_descr', 'transaction_list',
+    'transaction_totals', 'transaction_account', 'transaction_currency',
+    'parcel', 'parcels', 'parcels_by_transaction', 'parcels_by_tag',
+    'parcels_by_descr', 'parcel_account', 'parcel_currency', 'taglist',
+    'tag_names', 'tag_tree', 'tag_totals', 'monthly_by_account',
+    'monthly_by_tag', 'tags_by_parcel',
+}
+
+# FinStore methods that change the file, with the name of the argument
+# returned as their result, if any, to give the keys of new items
+_WRITES = {
+    'add_currency': 'currency', 'edt_currency': None,
+    'add_account': 'account', 'edt_account': None, 'del_account': None,
+    'set_snapshots': None, 'trim': None,
+    'add_transaction': 'transaction', 'add_transactions': 'transactions',
+    'edt_transaction_descr': None, 'edt_transaction_account': None,
+    'edt_transaction_date': None, 'del_transaction': None,
+    'add_parcel': 'parcel', 'edt_parcel_descr': None,
+    'edt_parcel_amount': None, 'del_parcel': None,
+    'add_parcel_tags': None, 'del_parcel_tags': None,
+    'edt_tag': None, 'del_tags': None,
+}
+
+
+def _call(store, method, params):
+    """Call a FinStore method with the JSON params and return its result
+       encoded in JSON.
+    """
+    function = getattr(store, method)
+    try:
+        if isinstance(params, list):
+            args = inspect.signature(function).bind(*params)
+        else:
+            args = inspect.signature(function).bind(**params)
+        for name, value in args.arguments.items():
+            if name in _ARGUMENTS:
+                args.arguments[name] = _ARGUMENTS[name](value)
+    except (TypeError, ValueError) as e:
+        raise _RPCError(_INVALID_PARAMS, str(e))
+
+    result = function(*args.args, **args.kwargs)
+    if _WRITES.get(method):
+        result = args.arguments[_WRITES[method]]
+        # account balances are set only when the changes are committed
+        if method == 'add_transaction':
+            result = store.transaction(result.key)
+        elif method == 'add_transactions':
+            result = [store.transaction(t.key) for t in result]
+    return json.dumps(result, default=vars)
+
+
+def _object(cls, data):
+    """Return an object of a FinStore class with the attributes of a JSON
+       object.  Other values are returned unchanged.
+    """
+    if not isinstance(data, dict):
+        return data
+
+    obj = cls()
+    for name, value in data.items():
+        if not hasattr(obj, name):
+            raise ValueError(f"Unknown {cls.__name__} attribute: {name}")
+        setattr(obj, name, value)
+    return obj
+
+
+def _transaction(data):
+    t = _object(FinStore.Transaction, data)
+    if isinstance(data, dict):
+        t.date = _date(t.date)
+        t.parcels = [_object(FinStore.Parcel, p) for p in t.parcels]
+    return t
+
+
+def _date(date):
+    return datetime.date.fromisoformat(date).isoformat()
+
+
+# Conversion of the JSON values of FinStore method arguments, by name
+_ARGUMENTS = {
+    'currency': lambda v: _object(FinStore.Currency, v),
+    'account': lambda v: _object(FinStore.Account, v),
+    'transaction': _transaction,
+    'transactions': lambda v: [_transaction(t) for t in v],
+    'parcel': lambda v: _object(FinStore.Parcel, v),
+    'date': _date,
+}
+
+
+#-----------------------------------------------------------------------------
+# JSON-RPC messages
+
+# error codes
+_PARSE_ERROR = -32700
+_INVALID_REQUEST = -32600
+_METHOD_NOT_FOUND = -32601
+_INVALID_PARAMS = -32602
+_INTERNAL_ERROR = -32603
+_STORE_ERROR = -32000
+_AUTH_ERROR = -32001
+
+# maximum length of a request line
+_MAX_REQUEST = 16 * 1024 * 1024
+
+
+class _RPCError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+def _response(rid, result=None, error=None):
+    """Return a response encoded in JSON, with a result already encoded.
+    """
+    if error:
+        return json.dumps({'jsonrpc': '2.0', 'id': rid,
+                           'error': {'code': error.code,
+                                     'message': str(error)}})
+    return f'{{"jsonrpc": "2.0", "id": {json.dumps(rid)}, "result": {result}}}'
+
+
+#-----------------------------------------------------------------------------
+# Server entry point
+
+def serve(fname, port, tokenfile, readers=4):
+    """Serve a Finance Control file on a local host port until interrupted
+       or terminated, writing the token of the clients to a file that is
+       removed at the end.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    tokenfile = os.path.expanduser(tokenfile)
+    server = RPCServer(fname, _write_token(tokenfile), readers)
+    try:
+        print(f"Serving '{fname}', token in '{tokenfile}'.", file=sys.stderr)
+        asyncio.run(server.serve(port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        with contextlib.suppress(OSError):
+            os.remove(tokenfile)
+
+
+def _write_token(path):
+    """Write a new random token to a file only the user may read and
+       return it.
+    """
+    token = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                       getattr(os, 'O_NOFOLLOW', 0), 0o600)
+    with os.fdopen(fd, 'w') as f:
+        # the file may already exist with other permissions
+        os.fchmod(fd, 0o600)
+        f.write(token + '\n')
+    return token
@@ -0,0 +1,195 @@
+"""
+Finance Control server: keeps a Finance Control file open in a single process
+and runs the commands sent to it through a Unix domain socket.
+
+Requests and responses are single lines of text.  A request is either a
+command line or a JSON object:
+    {"command": COMMAND_LINE, "format": "tsv"|"jsonl"}
+and the response is always a JSON object:
+    {"output": TEXT, "errors": TEXT, "status": 0|1}
+Connections are handled at the same time, each with its own command
+interpreter, but commands are run in batch mode, one at a time, in the order
+they arrive.
+The finclient module sends commands to the server.
+"""
+
+__version__ = '0.13'
+__date__ = '2026-10-18'
+__author__ = 'António Manuel Dias <ammdias@gmail.com>'
+__license__ = """
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import io
+import sys
+import json
+import signal
+import socket
+import contextlib
+import socketserver
+import concurrent.futures
+
+import finutil
+from finctrlcmd import FinCtrlCmd
+
+
+#-----------------------------------------------------------------------------
+class FinServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server running Finance Control commands on an open file.
+       Each connection is handled by its own thread, so an idle client
+       doesn't hold the others, and has its own command interpreter, so the
+       continued lines, echo setting and transaction history of a client
+       don't mix with those of the others.  But the file is opened and the
+       commands are run by a single runner thread, so changes to the file are
+       never made concurrently.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, fname, sockpath):
+        """Open the file and listen on the socket path.
+           A socket file left by a server that is no longer running is
+           replaced.
+        """
+        self._runner = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            self._runner.submit(self._open, fname).result()
+        except:
+            self._runner.shutdown()
+            raise
+
+        sockpath = os.path.expanduser(sockpath)
+        if os.path.exists(sockpath):
+            with socket.socket(socket.AF_UNIX) as s:
+                if s.connect_ex(sockpath) == 0:
+                    raise ValueError(f"A server is already listening on "
+                                     f"'{sockpath}'.")
+            os.remove(sockpath)
+
+        # only the owner of the server may connect to it
+        umask = os.umask(0o077)
+        try:
+            # on errors, server_close() is called and closes the file
+            socketserver.UnixStreamServer.__init__(self, sockpath, _Handler)
+        finally:
+            os.umask(umask)
+
+
+    def server_close(self):
+        """Close the socket, remove the socket file and close the file.
+        """
+        socketserver.ThreadingMixIn.server_close(self)
+        with contextlib.suppress(OSError):
+            os.remove(self.server_address)
+        self._runner.submit(self.fincmd._store.close).result()
+        self._runner.shutdown()
+
+
+    def _open(self, fname):
+        """Open the file in the runner thread.
+        """
+        self.fincmd = FinCtrlCmd()
+        self.fincmd.preloop()
+        finutil.batch = 'tsv'
+        self.fincmd.do_open(fname)
+        if not self.fincmd._store:
+            raise ValueError(f"Could not open file '{fname}'.")
+        self.fincmd.serving = True
+
+
+    def connect(self):
+        """Return a new command interpreter for a connection, using the open
+           file.
+        """
+        return self._runner.submit(self._connect).result()
+
+
+    def _connect(self):
+        """Create a command interpreter in the runner thread.
+        """
+        fincmd = FinCtrlCmd()
+        fincmd.preloop()
+        fincmd._store = self.fincmd._store
+        fincmd.serving = True
+        return fincmd
+
+
+    def run(self, fincmd, request):
+        """Run the command of a request with the command interpreter of its
+           connection, in the runner thread, and return the response.
+        """
+        try:
+            if request.lstrip().startswith('{'):
+                request = json.loads(request)
+                line, fmt = request['command'], request.get('format', 'tsv')
+            else:
+                line, fmt = request, 'tsv'
+            if not isinstance(line, str):
+                raise ValueError("The command must be a string.")
+            if fmt not in ('tsv', 'jsonl'):
+                raise ValueError(f"Unknown format: {fmt}")
+        except Exception as e:
+            return {'output': '', 'status': 1,
+                    'errors': f"*** Error: invalid request. Reason:\n    {e}\n"}
+
+        return self._runner.submit(self._run, fincmd, line, fmt).result()
+
+
+    def _run(self, fincmd, line, fmt):
+        """Run a command line and return the response.
+        """
+        out, err = io.StringIO(), io.StringIO()
+        errors = finutil.errors
+        finutil.batch = fmt
+        # the separator may have been changed through another connection
+        fincmd.csvsep = fincmd._store.metadata('csvsep')
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            line = fincmd.precmd(line)
+            if line:
+                fincmd.onecmd(line)
+
+        return {'output': out.getvalue(), 'errors': err.getvalue(),
+                'status': int(finutil.errors != errors)}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Handler of a connection: runs each request line and writes its
+       response line.
+    """
+
+    def handle(self):
+        fincmd = self.server.connect()
+        for request in self.rfile:
+            request = request.decode('utf-8').strip()
+            if request:
+                response = self.server.run(fincmd, request)
+                self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+#-----------------------------------------------------------------------------
+# Server entry point
+
+def serve(fname, sockpath):
+    """Serve a Finance Control file on a Unix socket until interrupted or
+       terminated.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with FinServer(fname, sockpath) as server:
+        print(f"Serving '{fname}' on '{sockpath}'.", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
@@ -2,8 +2,8 @@
 FinStore: class to store finance control data in a sqlite3 database.
 """
 
-__version__ = '0.12'
-__date__ = '2024-07-31'
+__version__ = '0.13'
+__date__ = '2026-10-18'
 __author__ = 'António Manuel Dias <ammdias@gmail.com>'
 __license__ = """
 This program is free software: you can redistribute it and/or modify
@@ -20,6 +20,11 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import re
+import copy
+import datetime
+import contextlib
+
 from sqlitestore import SQLiteStore
 
 
@@ -84,19 +89,76 @@ class FinStore(SQLiteStore):
 
     #--------------------------------------------------------------------------
 
-    def __init__(self, storepath, create=False, **metadata):
+    def __init__(self, storepath, create=False, readonly=False, **metadata):
         """Connect to database creating it if required and necessary.
            Set metadata in database.
+           A read-only storage must already have the current schema.
         """
-        SQLiteStore.__init__(self, storepath, create, **metadata)
+        self._deferred = None       # deferred balance changes
+        self._currencies = None     # cache of currencies by name
+        self._accounts = None       # cache of accounts by key
+        SQLiteStore.__init__(self, storepath, create, readonly, **metadata)
         with self._db:
             if create:
                 self._script(_SCRIPT_CREATE)
+        self._upgrade(backup=not create)
+
+
+    def _upgrade(self, backup=True):
+        """Upgrade storage schema to the current version.
+           Pending migration scripts are applied in order, each one in its own
+           transaction, and the schema version is recorded in the metadata.
+           Unless backup is False, the file is first copied to
+           '<file>.v<version>.bak', as older versions of the program can't
+           open upgraded files.
+        """
+        version = int(self.metadata('schema_version') or 0)
+        if version > len(_MIGRATIONS):
+            raise ValueError("Storage file was created by a newer version "
+                             "of the program.")
+        if self._readonly and version < len(_MIGRATIONS):
+            raise ValueError("Storage file must be upgraded before being "
+                             "opened read-only.")
+        if backup and version < len(_MIGRATIONS):
+            self.backup(f"{self._dbpath}.v{version}.bak")
+
+        for version, script in enumerate(_MIGRATIONS[version:], version + 1):
+            try:
+                self._script(f"begin;\n{script}\n"
+                             "replace into metadata "
+                             f"values('schema_version', '{version}');\n"
+                             "commit;")
+            except:
+                self._rollback()
+                raise
+            finally:
+                self._invalidate()
+
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Run a block of operations in a single database transaction,
+           deferring balance updates to the end of the block.
+           Balances are also brought up to date before being read inside
+           the block.
+        """
+        with self.atomic():
+            if self._deferred is not None:
+                yield
+                return
+
+            self._deferred = {}
+            try:
+                yield
+                self._flush_balances()
+            finally:
+                self._deferred = None
 
 
     def add_currency(self, currency):
         """Insert currency in the database.
         """
+        self._currencies = None
         c = self._do("insert into currencies values(?,?,?,?,?,?)",
                      (currency.name, currency.short_name,
                       currency.symbol, currency.symbol_pos,
@@ -106,37 +168,35 @@ class FinStore(SQLiteStore):
     def edt_currency(self, currency):
         """Change currency values.
         """
-        if not self._exists('currencies', 'name', currency.name):
+        self._currencies = None
+        c = self._do("update currencies set short_name=?, symbol=?, "
+                     "symbol_pos=?, dec_places=?, dec_sep=? where name=?",
+                     (currency.short_name, currency.symbol, currency.symbol_pos,
+                      currency.dec_places, currency.dec_sep, currency.name))
+        if c.rowcount == 0:
             raise ValueError("Currency not found.")
 
-        self._do("update currencies set short_name=?, symbol=?, symbol_pos=?, "
-                 "dec_places=?, dec_sep=? where name=?",
-                 (currency.short_name, currency.symbol, currency.symbol_pos,
-                  currency.dec_places, currency.dec_sep, currency.name))
-
 
     def currency(self, currname):
         """Return currency with name currname.
         """
-        curr = self._qry("select * from currencies where name like ?",
-                         (currname,))
+        match = _like(currname)
+        curr = [c for c in self._cache()[0].values() if match(c.name)]
         if len(curr) == 0:
             raise ValueError("Currency not found.")
         if len(curr) > 1:
             raise ValueError("Multiple currencies satisfy criteria.")
 
-        return self.Currency(*curr[0])
+        return copy.copy(curr[0])
 
 
     def currencies(self, name=None):
         """Return list of currencies.
         """
-        if name:
-            qry = ("select * from currencies where name like ?", (name,))
-        else:
-            qry = ("select * from currencies",)
+        match = _like(name) if name else None
 
-        return [self.Currency(*curr) for curr in self._qry(*qry)]
+        return [copy.copy(c) for c in self._cache()[0].values()
+                if not match or match(c.name)]
 
 
     def add_account(self, account):
@@ -145,6 +205,7 @@ class FinStore(SQLiteStore):
         if not account.name:
             raise ValueError("Account must have a name.")
 
+        self._accounts = None
         c = self._do("insert into accounts values(null,?,?,?,?)",
                       (account.name, account.balance, account.descr,
                        account.currency))
@@ -154,145 +215,341 @@ class FinStore(SQLiteStore):
     def edt_account(self, account):
         """Change account data.
         """
-        if not self._exists('accounts', 'key', account.key):
+        self._accounts = None
+        c = self._do("update accounts set name=?, descr=? where key=?",
+                     (account.name, account.descr, account.key))
+        if c.rowcount == 0:
             raise ValueError("Account not found.")
 
-        self._do("update accounts set name=?, descr=? where key=?",
-                 (account.name, account.descr, account.key))
-
 
     def del_account(self, acckey):
         """Remove account with key acckey.
         """
+        self._accounts = None
+        if self._deferred:
+            # keys of deleted accounts are reused, so the deferred changes of
+            # this one must not be applied to the next account added
+            self._deferred = {k: v for k, v in self._deferred.items()
+                              if k[0] != _key(acckey)}
         self._do("delete from accounts where key=?", (acckey,))
 
 
     def account(self, acckey):
         """Return account with key acckey.
         """
-        acc = self._qry1("select * from accounts where key=?", (acckey,))
+        self._flush_balances()
+        acc = self._cache()[1].get(_key(acckey))
         if not acc:
             raise ValueError("Account not found.")
 
-        return self.Account(*acc)
+        return copy.copy(acc)
 
 
     def accounts(self, name=None):
         """Return list of accounts.
         """
-        if name:
-            qry = ("select * from accounts where name like ?", (name,))
-        else:
-            qry = ("select * from accounts",)
+        self._flush_balances()
+        match = _like(name) if name else None
 
-        return [self.Account(*acc) for acc in self._qry(*qry)]
+        return [copy.copy(a) for a in self._cache()[1].values()
+                if not match or match(a.name)]
 
 
     def account_key(self, key_or_name):
         """Return account key given a key or name.
         """
-        if self._exists('accounts', 'key', key_or_name):
-            return key_or_name
+        accounts = self._cache()[1]
+        if _key(key_or_name) in accounts:
+            return _key(key_or_name)
 
-        res = self._qry("select key from accounts where name like ?",
-                        (key_or_name,))
+        match = _like(str(key_or_name))
+        res = [a.key for a in accounts.values() if match(a.name)]
         if len(res) > 1:
             raise ValueError("Multiple accounts satisfy criteria.")
         
-        return res[0][0] if res else None
+        return res[0] if res else None
 
 
     def account_currency(self, acckey):
         """Return the currency of an account.
         """
-        if not self._exists('accounts', 'key', acckey):
+        currencies, accounts = self._cache()
+        acc = accounts.get(_key(acckey))
+        if not acc:
             raise Exception("Account not found.")
 
-        curr = self._qry1("select C.* from accounts as A, currencies as C "
-                          "where A.key=? and C.name=A.currency", (acckey,))
+        curr = currencies.get(acc.currency)
  
-        return self.Currency(*curr) if curr else None
+        return copy.copy(curr) if curr else None
+
+
+    def _cache(self):
+        """Return the cached currencies and accounts dictionaries, loading
+           them from the database if needed.
+           The cache is discarded on changes to currencies or accounts, and on
+           changes to the database by other connections.
+        """
+        self._sync()
+        if self._currencies is None:
+            self._currencies = {c[0]: self.Currency(*c)
+                                for c in self._qry("select * from currencies")}
+        if self._accounts is None:
+            self._accounts = {a[0]: self.Account(*a)
+                              for a in self._qry("select * from accounts")}
+
+        return self._currencies, self._accounts
+
+
+    def _invalidate(self):
+        """Discard data cached from the database.
+        """
+        SQLiteStore._invalidate(self)
+        self._currencies = self._accounts = None
 
 
     def account_balance(self, acckey, date):
         """Return account balance at specified date.
         """
-        if not self._exists('accounts', 'key', acckey):
+        self._flush_balances()
+        if _key(acckey) not in self._cache()[1]:
             raise ValueError("Acccount not found.")
 
-        bal = self._qry1("select accbalance from transactions "
-                          "where account=? and date<=? "
-                          "order by date desc, key desc limit 1", (acckey, date))
+        return self._qry1("select " + self._sql_balance('?', '?'),
+                          (acckey, date))[0]
 
-        return bal[0] if bal else None
+
+    def balance_series(self, acckeys, datemin, datemax, every='month'):
+        """Return the balances of a list of accounts at the end of each day,
+           week (ending on sunday) or month from datemin to datemax, as a list
+           of (date, list of balances) tuples.  The last period ends at
+           datemax.
+        """
+        if every not in _SQL_PERIOD_END:
+            raise ValueError(f"Unknown period: {every}")
+        self._flush_balances()
+        end = _SQL_PERIOD_END[every]
+        balances = {}
+        for date, account, balance in self._qry(f"""
+                with recursive P(date) as (
+                    select min({end.format('?')}, ?)
+                    union all
+                    select min({end.format("date(date, '+1 day')")}, ?)
+                    from P where date<?
+                )
+                select P.date, A.key, coalesce({self._sql_balance('A.key',
+                                                                  'P.date')}, 0)
+                from P, accounts as A
+                where A.key in ({','.join('?' * len(acckeys))})
+                order by P.date""",
+                (datemin, datemax, datemax, datemax, *acckeys)):
+            balances.setdefault(date, {})[account] = balance
+
+        return [(date, [b.get(a, 0) for a in acckeys])
+                for date, b in balances.items()]
+
+
+    def snapshots(self):
+        """Return True if daily balance snapshots are enabled.
+        """
+        return self.metadata('balance_snapshots') == 'on'
+
+
+    def set_snapshots(self, enabled):
+        """Enable or disable the daily balance snapshots.
+           Enabling them (again) rebuilds the snapshots from the balance tree.
+           Snapshots hold the balance of an account at the end of each day
+           with balance changes, so a balance is read with a single seek of
+           the (account, date) primary key for the last snapshot up to the
+           day: O(log n) in the number of snapshots, against O(log d) reads
+           of balance tree nodes, d being the julian day number.  In return,
+           each balance change updates the snapshots of all the following
+           days of the account.
+        """
+        self._flush_balances()
+        with self.atomic():
+            self._exec("delete from dailybalances")
+            if enabled:
+                # the days of the balance tree nodes include all the days
+                # with balance changes, even of transactions removed by trim
+                self._exec("insert into dailybalances "
+                           "select D.account, D.date, " +
+                           _SQL_BALANCE.format(account='D.account',
+                                               date='D.date') +
+                           " from (select account, date(node + 0.5) as date "
+                           "       from balancetree as B where node <= "
+                           "         (select julianday(max(date)) "
+                           "          from transactions "
+                           "          where account=B.account)) as D")
+            self.set_metadata('balance_snapshots', 'on' if enabled else 'off')
+
+
+    def _sql_balance(self, account, date):
+        """Return the SQL expression of the balance of an account at the end
+           of a day, read from the snapshots if they are enabled (one index
+           seek) or else summed from the balance tree (one read of each of
+           the O(log d) nodes covering the day).
+        """
+        sql = _SQL_SNAPSHOT if self.snapshots() else _SQL_BALANCE
+        return sql.format(account=account, date=date)
 
 
-    def _upd_account_balance(self, acckey):
-        """Update account balance after transaction modifications.
+    def _sql_transaction(self):
+        """Return the transaction columns to be selected from the
+           transactions table aliased as T.
         """
-        self._exec("update accounts "
-                   "set balance=(select accbalance from transactions "
-                   "             where account=? "
-                   "             order by date desc, key desc limit 1) "
-                   "where key=?", (acckey, acckey))
+        return _SQL_TRANSACTION.format(
+                    balance=self._sql_balance('T.account', 'T.date'))
+
+
+    def _upd_balance(self, acckey, date, amount):
+        """Add amount to the account balance from date onwards.
+        """
+        self._upd_balances({(acckey, date): amount})
+
+
+    def _upd_balances(self, changes):
+        """Add amounts to account balances from the given dates onwards.
+           changes: dictionary of {(acckey, date): amount} items
+           Changes are kept to be applied later if balances are deferred.
+        """
+        if self._deferred is None:
+            self._apply_balances(changes)
+        else:
+            for k, amount in changes.items():
+                self._deferred[k] = self._deferred.get(k, 0) + amount
+
+
+    def _flush_balances(self):
+        """Apply deferred balance changes, if there are any.
+        """
+        if self._deferred:
+            self._apply_balances(self._deferred)
+            self._deferred = {}
+
+
+    def _apply_balances(self, changes):
+        """Apply balance changes to the balance tree and accounts.
+           Only the balance tree nodes covering the dates are updated, each
+           one a single time.
+        """
+        nodes, totals = {}, {}
+        for (acckey, date), amount in changes.items():
+            if not amount:
+                continue
+            totals[acckey] = totals.get(acckey, 0) + amount
+            node = _julian_day(date)
+            while node <= _TREE_SIZE:
+                nodes[acckey, node] = nodes.get((acckey, node), 0) + amount
+                node += node & -node
+
+        self._exmany("insert into balancetree values(?,?,?) "
+                     "on conflict(account, node) "
+                     "do update set amount=amount+excluded.amount",
+                     [(a, n, amount) for (a, n), amount in nodes.items()])
+        self._exmany("update accounts set balance=balance+? where key=?",
+                     [(amount, a) for a, amount in totals.items()])
+        if self.snapshots():
+            # add a snapshot for the day if there is none, carrying the
+            # previous balance, then add the amount to it and the later ones
+            for (acckey, date), amount in changes.items():
+                if not amount:
+                    continue
+                self._exec("insert or ignore into dailybalances "
+                           "select ?, ?, coalesce(" +
+                           _SQL_SNAPSHOT.format(account='?', date='?') +
+                           ", 0)", (acckey, date, acckey, date))
+                self._exec("update dailybalances set balance=balance+? "
+                           "where account=? and date>=?",
+                           (amount, acckey, date))
+        # keep cached accounts up to date
+        if self._accounts is not None:
+            for a, amount in totals.items():
+                if a in self._accounts:
+                    self._accounts[a].balance += amount
 
 
     def trim(self, date, acckey=None):
         """Remove all transactions up to date.
         """
+        self._flush_balances()
         accounts = [acckey] if acckey else \
                    [i[0] for i in self._qry("select key from accounts")]
 
         for a in accounts:
-            self._do("delete from transactions where account=? and date<=?",
-                     (a, date))
-            # check if all transactions were deleted
-            if not self._qry1("select count() from transactions where account=?",
-                              (a,))[0]:
-                t = self.Transaction()
-                t.account = a
-                t.date = date
-                t.descr = "Trim carry-over"
-                amm = self._qry1("select balance from accounts where key=?", (a,))[0]
-                t.parcels = [self.Parcel(None, 0, "Trim carry-over", amm)]
-                self.add_transaction(t)
+            # the balance tree is left untouched, so the trimmed transactions
+            # are still accounted for in the balances of the remaining ones
+            with self.atomic():
+                self._exec("delete from transactions where account=? and date<=?",
+                           (a, date))
+                # check if all transactions were deleted
+                if not self._qry1("select count() from transactions "
+                                  "where account=?", (a,))[0]:
+                    t = self.Transaction()
+                    t.account = a
+                    t.date = date
+                    t.descr = "Trim carry-over"
+                    amm = self._qry1("select balance from accounts where key=?",
+                                     (a,))[0]
+                    t.parcels = [self.Parcel(None, 0, "Trim carry-over", amm)]
+                    self._insert_transactions([t])
 
 
     def add_transaction(self, transaction):
         """Insert transaction in database.
         """
-        with self._db:
-            accbal = self._get_trans_accbalance(transaction.account,
-                                                transaction.date)
-            c = self._exec("insert into transactions values(null,?,?,?,0,?)",
-                           (transaction.account, transaction.date,
-                            transaction.descr, accbal))
-            transaction.key = c.lastrowid
-
-            for p in transaction.parcels:
-                c = self._exec("insert into parcels values(null,?,?,?)",
-                               (transaction.key, p.descr, p.amount))
-                p.key = c.lastrowid
-                for t in p.tags:
-                    self._exec("insert into parceltags values(?,?)", (p.key, t))
-
-            total = self._qry1("select sum(amount) from parcels "
-                               "where trans=?", (transaction.key,))[0]
-            self._exec("update transactions set amount=? "
-                       "where key=?", (total, transaction.key))
-            self._upd_trans_accbalance(transaction.key, transaction.account,
-                                       total, transaction.date)
+        self.add_transactions([transaction])
+
+
+    def add_transactions(self, transactions):
+        """Insert a sequence of transactions in database.
+           All transactions are inserted in a single database transaction and
+           the balances are updated once for all of them.
+        """
+        with self.atomic():
+            self._upd_balances(self._insert_transactions(transactions))
+
+
+    def _insert_transactions(self, transactions):
+        """Insert transactions and their parcels, without updating balances.
+           Transactions are sorted by account and date before insertion.
+           Return dictionary of balance changes by account and date.
+           Must be called inside an atomic() block.
+        """
+        # take the write lock before reading the last keys, so that other
+        # connections can't insert rows with the same keys in between
+        if not self._db.in_transaction:
+            self._exec("begin immediate")
+        tkey = self._qry1("select coalesce(max(key), 0) from transactions")[0]
+        pkey = self._qry1("select coalesce(max(key), 0) from parcels")[0]
+        trows, prows, tagrows, changes = [], [], [], {}
+        for t in sorted(transactions, key=lambda t: (t.account, t.date)):
+            tkey += 1
+            t.key = tkey
+            t.amount = sum(p.amount for p in t.parcels)
+            trows.append((t.key, t.account, t.date, t.descr, t.amount))
+            for p in t.parcels:
+                pkey += 1
+                p.key, p.trans = pkey, t.key
+                prows.append((p.key, p.trans, p.descr, p.amount))
+                tagrows.extend((p.key, tag) for tag in p.tags)
+            changes[t.account, t.date] = \
+                changes.get((t.account, t.date), 0) + t.amount
+
+        self._exmany("insert into transactions values(?,?,?,?,?)", trows)
+        self._exmany("insert into parcels values(?,?,?,?)", prows)
+        self._insert_tags(tagrows)
+
+        return changes
 
 
     def edt_transaction_descr(self, transkey, descr):
         """Change transaction description.
         """
-        if not self._exists("transactions", "key", transkey):
+        c = self._do("update transactions set descr=? where key=?",
+                     (descr, transkey))
+        if c.rowcount == 0:
             raise ValueError("Transaction not found.")
 
-        self._do("update transactions set descr=? where key=?",
-                 (descr, transkey))
-
 
     def edt_transaction_account(self, transkey, acckey):
         """Change transaction account.
@@ -300,7 +557,7 @@ class FinStore(SQLiteStore):
         t = self.transaction(transkey)
         if not t:
             raise ValueError("Transaction not found.")
-        if not self._exists("accounts", "key", acckey):
+        if _key(acckey) not in self._cache()[1]:
             raise ValueError("Account not found.")
         if t.account == acckey:
             raise ValueError("Cannot transfer transaction to the same account.")
@@ -319,32 +576,31 @@ class FinStore(SQLiteStore):
             raise ValueError("Transaction not found.")
         oldate, acckey, amount = t
 
-        with self._db:
-            self._upd_trans_accbalance(transkey, acckey, -amount, oldate)
-            accbal = self._get_trans_accbalance(acckey, date, transkey)
-            self._exec("update transactions set date=?, accbalance=? "
-                       "where key=?",
-                       (date, accbal, transkey))
-            self._upd_trans_accbalance(transkey, acckey, amount, date)
+        with self.atomic():
+            self._exec("update transactions set date=? where key=?",
+                       (date, transkey))
+            self._upd_balance(acckey, oldate, -amount)
+            self._upd_balance(acckey, date, amount)
 
 
     def del_transaction(self, transkey):
         """Remove transaction with key transkey.
         """
-        t = self._qry1("select account, amount, date "
-                       "from transactions where key=?", (transkey,))
-        if not t:
-            raise ValueError("Transaction not found.")
-        acckey, amount, date = t
-        with self._db:
-            self._exec("delete from transactions where key=?", (transkey,))
-            self._upd_trans_accbalance(transkey, acckey, -amount, date)
+        with self.atomic():
+            t = self._qry("delete from transactions where key=? "
+                          "returning account, amount, date", (transkey,))
+            if not t:
+                raise ValueError("Transaction not found.")
+            acckey, amount, date = t[0]
+            self._upd_balance(acckey, date, -amount)
 
 
     def transaction(self, transkey):
         """Return transaction with key transkey.
         """
-        t = self._qry1("select * from transactions where key=?", (transkey,))
+        self._flush_balances()
+        t = self._qry1(f"select {self._sql_transaction()} from transactions as T "
+                       "where key=?", (transkey,))
         if not t:
             raise ValueError("Transaction not found.")
         t = self.Transaction(*t)
@@ -356,17 +612,162 @@ class FinStore(SQLiteStore):
                            datemin=None, datemax=None, limit=None):
         """Return list of transactions.
         """
+        self._flush_balances()
+        cond, params = self._transactions_filter(acckey, amount, to_amount,
+                                                 datemin, datemax)
+        lim = f"limit {int(limit)}" if limit else ''
+
+        return [self.Transaction(*t)
+                for t in self._qry(f"select {self._sql_transaction()} "
+                                   f"from transactions as T {cond} "
+                                   f"order by T.date desc, T.key desc {lim}",
+                                   params)]
+
+
+    def transactions_by_descr(self, pattern, datemin=None, datemax=None,
+                                    limit=None, fulltext=False):
+        """Return list of transactions in which the description includes pattern.
+           If fulltext is True, pattern is a full-text query instead.
+        """
+        if not str(pattern):
+            raise ValueError('Pattern is empty.')
+        self._flush_balances()
+        cond, params = self._transactions_filter(datemin=datemin,
+                                                 datemax=datemax,
+                                                 pattern=pattern,
+                                                 fulltext=fulltext)
+        lim = f"limit {int(limit)}" if limit else ''
+
+        return [self.Transaction(*t)
+                for t in self._qry(f"select {self._sql_transaction()} "
+                                   f"from transactions as T {cond} "
+                                   f"order by T.date desc, T.key desc {lim}",
+                                   params)]
+
+
+    def transaction_list(self, acckey=None, amount=None, to_amount=None,
+                               datemin=None, datemax=None, limit=None,
+                               pattern=None, fulltext=False,
+                               after=None, rev=False, offset=0):
+        """Return list of transactions joined with the name and currency of
+           their accounts, as (transaction, account name, currency) tuples.
+           Filters are the same of transactions() and transactions_by_descr().
+           Transactions are ordered from the most recent, or from the oldest if
+           rev is True.  To read them by pages, set after to the (date, key)
+           of the last transaction of the previous page.
+        """
+        return list(self.iter_transaction_list(acckey, amount, to_amount,
+                                               datemin, datemax, limit,
+                                               pattern, fulltext,
+                                               after, rev, offset))
+
+
+    def iter_transaction_list(self, acckey=None, amount=None, to_amount=None,
+                                    datemin=None, datemax=None, limit=None,
+                                    pattern=None, fulltext=False,
+                                    after=None, rev=False, offset=0):
+        """Iterate over transactions as transaction_list().
+           Transactions are read from the database as they are consumed.
+        """
+        if pattern is not None and not str(pattern):
+            raise ValueError('Pattern is empty.')
+        self._flush_balances()
+        cond, params = self._transactions_filter(acckey, amount, to_amount,
+                                                 datemin, datemax, pattern,
+                                                 fulltext)
+        if after:
+            cond = f"{cond} and" if cond else "where"
+            cond += f" (T.date, T.key) {'>' if rev else '<'} (?, ?)"
+            params += tuple(after)
+        order = 'asc' if rev else 'desc'
+        lim = f"limit {int(limit) if limit else -1}"
+        if offset:
+            lim += f" offset {int(offset)}"
+
+        currencies = {}
+        for row in self._exec(f"select {self._sql_transaction()}, A.name, C.* "
+                              "from transactions as T "
+                              "join accounts as A on A.key=T.account "
+                              "join currencies as C on C.name=A.currency "
+                              f"{cond} order by T.date {order}, T.key {order} "
+                              f"{lim}", params):
+            curr = currencies.get(row[7])
+            if not curr:
+                curr = currencies[row[7]] = self.Currency(*row[7:])
+            yield self.Transaction(*row[:6]), row[6], curr
+
+
+    def transaction_totals(self, acckey=None, amount=None, to_amount=None,
+                                 datemin=None, datemax=None, limit=None,
+                                 pattern=None, fulltext=False):
+        """Return the number and total amount of transactions by currency, as
+           (currency name, number, total) tuples, for the same arguments of
+           transaction_list().
+        """
+        if pattern is not None and not str(pattern):
+            raise ValueError('Pattern is empty.')
+        cond, params = self._transactions_filter(acckey, amount, to_amount,
+                                                 datemin, datemax, pattern,
+                                                 fulltext)
+        lim = f"order by T.date desc, T.key desc limit {int(limit)}" \
+              if limit else ''
+
+        return self._qry("select A.currency, count(*), sum(X.amount) "
+                         "from (select T.account, T.amount from transactions as T "
+                         f"      {cond} {lim}) as X "
+                         "join accounts as A on A.key=X.account "
+                         "group by A.currency order by A.currency", params)
+
+
+    def iter_column(self, column, acckey=None, amount=None, to_amount=None,
+                          datemin=None, datemax=None):
+        """Iterate over the values of a column of the transactions selected
+           by the filters of transactions(), of their parcels or of the tags
+           of their parcels.  Columns are:
+             trans, account, julianday, amount: transaction key, account,
+               julian day number of the date and amount, ordered by
+               transaction key
+             parcel, parcel_trans, parcel_amount: parcel key, transaction
+               key and amount, ordered by parcel key
+             tag_parcel, tag: parcel key and tag key of the parcel tags,
+               ordered by parcel and tag key
+        """
+        if column not in _SQL_COLUMNS:
+            raise ValueError(f"Unknown column: {column}")
+        cond, params = self._transactions_filter(acckey, amount, to_amount,
+                                                 datemin, datemax)
+        expr, source = _SQL_COLUMNS[column]
+
+        return (r[0] for r in self._exec(f"select {expr} "
+                                         f"{source.format(cond=cond)}",
+                                         params))
+
+
+    def _transactions_filter(self, acckey=None, amount=None, to_amount=None,
+                                   datemin=None, datemax=None, pattern=None,
+                                   fulltext=False):
+        """Return the where clause and parameters to filter transactions
+           (table aliased as T) by accounts, amount, dates and description.
+           The description pattern is a full-text query if fulltext is True.
+        """
         conds, params = [], []
         if acckey:
             if not isinstance(acckey, (list, tuple)):
                 acckey = [acckey]
-            conds = [f"({' or '.join(['account=?']*len(acckey))})"]
-            params = acckey
+            conds = [f"({' or '.join(['T.account=?']*len(acckey))})"]
+            params = list(acckey)
+        if pattern and fulltext:
+            conds.append("T.key in (select rowid from transactions_fts "
+                         "          where transactions_fts match ?)")
+            params.append(pattern)
+        elif pattern:
+            conds.append("T.descr like ?")
+            params.append(f'%{pattern}%')
         if datemin:
-            conds.append("date>=?")
+            conds.append("T.date>=?")
             params.append(datemin)
         if datemax:
-            conds.append("date<=?")
+            conds.append("T.date<=?")
             params.append(datemax)
         match amount, to_amount:
             case None, None:
@@ -374,185 +775,116 @@ class FinStore(SQLiteStore):
             case None, t:
                 raise ValueError("Upper amount set without lower amount.")
             case a, None:
-                conds.append("amount=?")
+                conds.append("T.amount=?")
                 params.append(a)
             case a, t:
                 if a > t:
                     a, t = t, a
-                conds.append("amount>=? and amount<=?")
+                conds.append("T.amount>=? and T.amount<=?")
                 params.append(a)
                 params.append(t)
 
         cond = f"where {' and '.join(conds)}" if conds else ''
-        lim = f"limit {int(limit)}" if limit else ''
-
-        return [self.Transaction(*t)
-                for t in self._qry(f"select * from transactions "
-                                   f"{cond} order by date desc, key desc {lim}",
-                                   tuple(params))]
-
-
-    def transactions_by_descr(self, pattern, datemin=None, datemax=None, limit=None):
-        """Return list of transactions in which the description includes pattern.
-        """
-        if not str(pattern):
-            raise ValueError('Pattern is empty.')
-
-        conds, params = ["descr like ?"], [f'%{pattern}%']
-
-        if datemin:
-            conds.append("date>=?")
-            params.append(datemin)
-        if datemax:
-            conds.append("date<=?")
-            params.append(datemax)
-
-        conds = " and ".join(conds)
-        lim = f"limit {int(limit)}" if limit else ''
 
-        return [self.Transaction(*t)
-                for t in self._qry(f"select * from transactions where {conds} "
-                                   f"order by date desc, key desc {lim}",
-                                   tuple(params))]
+        return cond, tuple(params)
 
 
     def transaction_account(self, transkey):
         """Return account of a transaction.
         """
-        if not self._exists('transactions', 'key', transkey):
+        self._flush_balances()
+        acc = self._qry1("select A.* from transactions as T "
+                         "left join accounts as A on A.key=T.account "
+                         "where T.key=?", (transkey,))
+        if not acc:
             raise ValueError("Transaction not found.")
 
-        acc = self._qry1("select A.* from accounts as A, transactions as T "
-                         "where T.key=? and A.key=T.account", (transkey,))
-        
-        return self.Account(*acc) if acc else None
+        return self.Account(*acc) if acc[0] is not None else None
 
 
     def transaction_currency(self, transkey):
         """Return the currency of a transaction.
         """
-        if not self._exists('transactions', 'key', transkey):
+        curr = self._qry1("select C.* from transactions as T "
+                          "left join accounts as A on A.key=T.account "
+                          "left join currencies as C on C.name=A.currency "
+                          "where T.key=?", (transkey,))
+        if not curr:
             raise Exception("Transaction not found.")
 
-        curr = self._qry1("select C.* "
-                          "from transactions as T, accounts as A, currencies as C "
-                          "where T.key=? and A.key=T.account and C.name=A.currency",
-                          (transkey,))
- 
-        return self.Currency(*curr) if curr else None
-
-
-    def _get_trans_accbalance(self, acckey, date, transkey=None):
-        """Get account balance on a specific date and transaction order.
-        """
-        # multiple transactions on same date, accbalance is accbalance of
-        # transaction with highest transaction key less than transkey
-        if transkey and self._qry1("select count() from transactions "
-                                   "where account=? and date=?",
-                                   (acckey, date))[0]:
-            accbal = self._qry1("select accbalance from transactions "
-                                "where key<? and account=? and date=? "
-                                "order by date desc, key desc limit 1",
-                                (transkey, acckey, date))
-
-        # first transaction at date, accbalance is accbalance from
-        # transaction with highest key and date less than date
-        else:
-            accbal = self._qry1("select accbalance from transactions "
-                                "where account=? and date<=? "
-                                "order by date desc, key desc limit 1",
-                                (acckey, date))
-
-        return accbal[0] if accbal else 0
-
-
-    def _upd_trans_accbalance(self, transkey, acckey, amount, date):
-        """Update transactions account balances after a transaction modification.
-        """
-        self._exec("update transactions set accbalance=accbalance+? "
-                   "where date=? and key>=? and account=?",
-                   (amount, date, transkey, acckey))
-        self._exec("update transactions set accbalance=accbalance+? "
-                   "where date>? and account=?",
-                   (amount, date, acckey))
-        self._upd_account_balance(acckey)
+        return self.Currency(*curr) if curr[0] is not None else None
 
 
     def add_parcel(self, parcel):
         """Insert a parcel.
         """
-        t = self._qry1("select key, account, date from transactions "
-                       "where key=?", (parcel.trans,))
-        if not t:
-            raise ValueError("Transaction not found.")
-        transkey, acckey, date = t
-        with self._db:
+        with self.atomic():
+            t = self._qry("update transactions set amount=amount+? "
+                          "where key=? returning account, date",
+                          (parcel.amount, parcel.trans))
+            if not t:
+                raise ValueError("Transaction not found.")
+            acckey, date = t[0]
             c = self._exec("insert into parcels values(null,?,?,?)",
                            (parcel.trans, parcel.descr, parcel.amount))
             parcel.key = c.lastrowid
-            for t in parcel.tags:
-                self._exec("insert into parceltags values(?, ?)",
-                           (parcel.key, t))
-            self._exec("update transactions set amount=amount+? "
-                       "where key=?", (parcel.amount, parcel.trans))
-            self._upd_trans_accbalance(transkey, acckey, parcel.amount, date)
+            self._insert_tags([(parcel.key, t) for t in parcel.tags])
+            self._upd_balance(acckey, date, parcel.amount)
 
 
     def edt_parcel_descr(self, parcelkey, descr):
         """Change parcel description.
         """
-        if not self._exists("parcels", "key", parcelkey):
+        c = self._do("update parcels set descr=? where key=?",
+                     (descr, parcelkey,))
+        if c.rowcount == 0:
             raise ValueError("Parcel not found.")
-        self._do("update parcels set descr=? where key=?", (descr, parcelkey,))
 
 
     def edt_parcel_amount(self, parcelkey, amount):
         """Change parcel amount.
         """
-        p = self._qry1("select trans, amount from parcels where key=?",
-                       (parcelkey,))
+        p = self._qry1("select P.trans, P.amount, T.account, T.date "
+                       "from parcels as P, transactions as T "
+                       "where P.key=? and T.key=P.trans", (parcelkey,))
         if not p:
             raise ValueError("Parcel not found.")
-        transkey, oldamm = p
-        acckey, date = self._qry1("select account, date from transactions "
-                                  "where key=?", (transkey,))
-        with self._db:
+        transkey, oldamm, acckey, date = p
+        with self.atomic():
             self._exec("update parcels set amount=? where key=?",
                        (amount, parcelkey,))
             self._exec("update transactions set amount=amount+? "
                        "where key=?", (amount-oldamm, transkey))
-            self._upd_trans_accbalance(transkey, acckey, amount-oldamm, date)
+            self._upd_balance(acckey, date, amount-oldamm)
 
 
     def del_parcel(self, parcelkey):
         """Remove parcel.
         """
-        p = self._qry1("select trans, amount from parcels where key=?",
-                       (parcelkey,))
-        if not p:
-            raise ValueError("Parcel not found.")
-        transkey, amount = p
-        acckey, date = self._qry1("select account, date from transactions "
-                                  "where key=?", (transkey,))
-        with self._db:
-            self._exec("delete from parcels where key=?", (parcelkey,))
-            self._exec("update transactions set amount=amount-? "
-                       "where key=?", (amount, transkey))
-            self._upd_trans_accbalance(transkey, acckey, -amount, date)
+        with self.atomic():
+            p = self._qry("delete from parcels where key=? "
+                          "returning trans, amount", (parcelkey,))
+            if not p:
+                raise ValueError("Parcel not found.")
+            transkey, amount = p[0]
+            acckey, date = self._qry1("update transactions "
+                                      "set amount=amount-? where key=? "
+                                      "returning account, date",
+                                      (amount, transkey))
+            self._upd_balance(acckey, date, -amount)
 
 
     def add_parcel_tags(self, parcelkey, tags):
         """Add a tag or list of tags to a parcel.
         """
-        if not self._exists("parcels", "key", parcelkey):
-            raise ValueError("Parcel not found.")
-        
         if type(tags) is str:
             tags = [tags]
-        with self._db:
-            for t in tags:
-                self._exec("insert into parceltags values (?, ?)",
-                            (parcelkey, t))
+        if not tags:
+            return
+        with self.atomic():
+            if self._insert_tags([(parcelkey, t) for t in tags]) == 0 and \
+               not self._exists("parcels", "key", parcelkey):
+                raise ValueError("Parcel not found.")
 
 
     def del_parcel_tags(self, parcelkey, tags):
@@ -560,25 +892,40 @@ class FinStore(SQLiteStore):
         """
         if type(tags) is str:
             tags = [tags]
-        with self._db:
-            for t in tags:
-                self._exec("delete from parceltags where parcel=? and tag=?",
-                          (parcelkey, t))
+        self._domany("delete from parceltags where parcel=? and "
+                     "tag=(select key from tags where name=?)",
+                     [(parcelkey, t) for t in tags])
+
+
+    def _insert_tags(self, rows):
+        """Tag parcels from a list of (parcel key, tag name) pairs, adding
+           new tags to the tags table.  Tags the parcels already have are
+           ignored.
+           Return the number of parcel tags inserted.
+        """
+        self._exmany("insert into tags(name) values(?) on conflict do nothing",
+                     [(t,) for t in {t for _, t in rows}])
+        return self._exmany("insert or ignore into parceltags "
+                            "select P.key, T.key from parcels as P, tags as T "
+                            "where P.key=? and T.name=?", rows).rowcount
 
 
     def parcel(self, parcelkey):
         """Return parcel with key parcelkey.
         """
-        p = self._qry1("select * from parcels where key=?", (parcelkey,))
-        if p:
-            p = self.Parcel(*p)
-            self.fill_tags([p])
-        return p
+        return next(self._parcels("where P.key=?", (parcelkey,)), None)
 
 
     def parcels(self, datemin=None, datemax=None, amount=None, limit=None):
         """Return list of parcels according to preset conditions.
         """
+        return list(self.iter_parcels(datemin, datemax, amount, limit))
+
+
+    def iter_parcels(self, datemin=None, datemax=None, amount=None, limit=None):
+        """Iterate over parcels according to preset conditions.
+           Parcels are read from the database as they are consumed.
+        """
         conds, params = [], []
         if datemin:
             conds.append("T.date>=?")
@@ -587,43 +934,48 @@ class FinStore(SQLiteStore):
             conds.append("T.date<=?")
             params.append(datemax)
         if amount:
-            conds.append("amount=?")
+            conds.append("P.amount=?")
             params.append(amount)
 
         conds = "and " + " and ".join(conds) if conds else ''
         lim = f"limit {int(limit)}" if limit else ''
 
-        plist = [self.Parcel(*p)
-                 for p in self._qry("select P.* "
-                                    "from transactions as T, parcels as P "
-                                    f"where P.trans=T.key {conds} "
-                                    f"group by T.key "
-                                    f"order by T.key desc, T.date desc, P.key desc {lim}",
-                                    tuple(params))]
-        self.fill_tags(plist)
-
-        return plist
+        return self._parcels(", transactions as T "
+                             f"where P.trans=T.key {conds} "
+                             f"group by T.key "
+                             f"order by T.key desc, T.date desc, P.key desc {lim}",
+                             tuple(params))
 
 
     def parcels_by_transaction(self, transaction):
         """Return list of parcels in a transaction.
         """
-        plist = [self.Parcel(*p)
-                 for p in self._qry("select * from parcels where trans=?",
-                                     (transaction,))]
-        self.fill_tags(plist)
+        return list(self._parcels("where P.trans=?", (transaction,)))
 
-        return plist
+
+    def _parcels(self, cond, params):
+        """Iterate over parcels, with their tags, selected from the parcels
+           table (aliased as P) by the given SQL condition.
+        """
+        for p in self._exec(f"select {_SQL_PARCEL} from parcels as P {cond}",
+                            params):
+            parcel = self.Parcel(*p[:4])
+            parcel.tags = p[4].split(_TAGSEP) if p[4] else []
+            yield parcel
 
 
     def parcels_by_tag(self, tags, datemin=None, datemax=None, limit=0):
-        """Return parcels by tag according to conditions.
+        """Return parcels by tag according to conditions, as (key, date,
+           transaction key, description, amount, account name, currency name)
+           tuples.
+           Tags are 'like' patterns, or 'TAG/*' to select a tag and all the
+           tags below it in the hierarchy.
         """
         if not tags or type(tags)!=list:
             raise ValueError("tags is not a non-empty list of tags.")
 
-        cond, params = [], tags
-        tagcond = '(' + 'or '.join(["PT.tag like ?"] * len(tags)) + ')'
+        tagcond, params = self._tags_filter(tags)
+        cond, params = [], list(params)
 
         if datemin:
             cond.append("T.date>=?")
@@ -636,20 +988,49 @@ class FinStore(SQLiteStore):
         lim = f"limit {int(limit)}" if limit else ''
 
         return self._qry(
-                "select distinct P.key, T.date, T.key, P.descr, P.amount "
-                "from transactions as T, parcels as P, parceltags as PT "
-                f"where PT.parcel=P.key and P.trans=T.key and {tagcond} {cond} "
+                "select distinct P.key, T.date, T.key, P.descr, P.amount, "
+                "                A.name, A.currency "
+                "from transactions as T, parcels as P, parceltags as PT, "
+                "     accounts as A "
+                "where PT.parcel=P.key and P.trans=T.key and A.key=T.account and "
+                f"PT.tag in ({tagcond}) {cond} "
                 f"order by T.date desc, T.key desc, P.key desc {lim}",
                          tuple(params))
 
     
-    def parcels_by_descr(self, pattern, datemin=None, datemax=None, limit=0):
-        """Return list of parcels in wich description includes pattern.
+    def _tags_filter(self, tags):
+        """Return query selecting the keys of a list of tags, and its
+           parameters.  Tags are 'like' patterns, or 'TAG/*' to select a tag
+           and all the tags below it in the hierarchy.
+        """
+        conds, params = [], []
+        for tag in tags:
+            if tag.endswith('/*'):
+                # range scan on the tags_name index: 'TAG/' <= name < 'TAG0'
+                conds.append("name=? or (name>=? and name<?)")
+                params.extend((tag[:-2], tag[:-1], tag[:-2] + _TAGEND))
+            else:
+                conds.append("name like ?")
+                params.append(tag)
+
+        return f"select key from tags where {' or '.join(conds)}", tuple(params)
+
+
+    def parcels_by_descr(self, pattern, datemin=None, datemax=None, limit=0,
+                               fulltext=False):
+        """Return list of parcels in wich description includes pattern, as
+           (key, date, transaction key, description, amount, account name,
+           currency name) tuples.
+           If fulltext is True, pattern is a full-text query instead.
         """
         if not str(pattern):
             raise ValueError("empty pattern.")
 
-        conds, params = ["P.descr like ?"], [f'%{pattern}%']
+        if fulltext:
+            conds, params = ["P.key in (select rowid from parcels_fts "
+                             "          where parcels_fts match ?)"], [pattern]
+        else:
+            conds, params = ["P.descr like ?"], [f'%{pattern}%']
 
         if datemin:
             conds.append("T.date>=?")
@@ -662,9 +1043,10 @@ class FinStore(SQLiteStore):
         lim = f"limit {int(limit)}" if limit else ''
 
         return self._qry(
-                "select distinct P.key, T.date, T.key, P.descr, P.amount "
-                "from transactions as T, parcels as P "
-                f"where P.trans=T.key and {conds} "
+                "select distinct P.key, T.date, T.key, P.descr, P.amount, "
+                "                A.name, A.currency "
+                "from transactions as T, parcels as P, accounts as A "
+                f"where P.trans=T.key and A.key=T.account and {conds} "
                 f"order by T.date desc, T.key desc, P.key desc {lim}",
                          tuple(params))
 
@@ -672,36 +1054,48 @@ class FinStore(SQLiteStore):
     def parcel_account(self, parcelkey):
         """Return account of a parcel.
         """
-        if not self._exists('parcels', 'key', parcelkey):
+        self._flush_balances()
+        acc = self._qry1("select A.* from parcels as P "
+                         "left join transactions as T on T.key=P.trans "
+                         "left join accounts as A on A.key=T.account "
+                         "where P.key=?", (parcelkey,))
+        if not acc:
             raise ValueError("Parcel not found.")
 
-        acc = self._qry1("select A.* "
-                         "from accounts as A, transactions as T, parcels as P  "
-                         "where P.key=? and T.key=P.trans and A.key=T.account",
-                         (parcelkey,))
-        
-        return self.Account(*acc) if acc else None
+        return self.Account(*acc) if acc[0] is not None else None
 
 
     def parcel_currency(self, parcelkey):
         """Return currency of a parcel.
         """
-        if not self._exists('parcels', 'key', parcelkey):
+        curr = self._qry1("select C.* from parcels as P "
+                          "left join transactions as T on T.key=P.trans "
+                          "left join accounts as A on A.key=T.account "
+                          "left join currencies as C on C.name=A.currency "
+                          "where P.key=?", (parcelkey,))
+        if not curr:
             raise ValueError("Parcel not found.")
 
-        curr = self._qry1("select C.* from parcels as P, transactions as T, "
-                          "                accounts as A, currencies as C "
-                          "where P.key=? and T.key=P.trans and "
-                          "      A.key=T.account and C.name=A.currency",
-                          (parcelkey,))
- 
-        return self.Currency(*curr) if curr else None
+        return self.Currency(*curr) if curr[0] is not None else None
 
 
     def edt_tag(self, oldtag, newtag):
         """Change a tag name.
+           If a tag named newtag already exists, both are merged.
         """
-        self._do("update parceltags set tag=? where tag=?", (newtag, oldtag))
+        with self.atomic():
+            old = self._qry1("select key from tags where name=?", (oldtag,))
+            if not old:
+                raise ValueError("Tag not found.")
+            new = self._qry1("select key from tags where name=?", (newtag,))
+            if not new or new[0] == old[0]:
+                self._exec("update tags set name=? where key=?",
+                           (newtag, old[0]))
+            else:
+                self._exec("insert or ignore into parceltags "
+                           "select parcel, ? from parceltags where tag=?",
+                           (new[0], old[0]))
+                self._exec("delete from parceltags where tag=?", (old[0],))
 
 
     def del_tags(self, tags):
@@ -709,32 +1103,163 @@ class FinStore(SQLiteStore):
         """
         if type(tags) is str:
             tags = [tags]
-        with self._db:
-            for t in tags:
-                self._exec("delete from parceltags where tag=?", (t,))
+        self._domany("delete from parceltags "
+                     "where tag=(select key from tags where name=?)",
+                     [(t,) for t in tags])
 
 
     def taglist(self):
         """Return list of unique tags.
         """
-        return self._qry("select T,(select count() from parceltags where tag=T) "
-                         "from (select distinct tag as T from parceltags) "
-                         "order by T")
+        return self._qry("select name, counter from tags where counter>0 "
+                         "order by name")
+
+
+    def tag_names(self):
+        """Return dictionary of tag names by key.
+        """
+        return dict(self._qry("select key, name from tags"))
+
+
+    def tag_tree(self):
+        """Return list of the nodes of the tag hierarchy with the number and
+           total amount of their parcels, and of the parcels of the tags
+           below them, by currency, as (node, currency name, number, total)
+           tuples ordered by node.
+        """
+        return self._qry("""
+            with recursive
+                -- each tag and its ancestors, split at the '/' separators
+                N(tag, node, rest) as (
+                    select key, '', name || '/' from tags where counter>0
+                    union all
+                    select tag,
+                           node || iif(node='', '', '/') ||
+                               substr(rest, 1, instr(rest, '/') - 1),
+                           substr(rest, instr(rest, '/') + 1)
+                    from N where rest<>''
+                ),
+                D(node, parcel) as (
+                    select N.node, PT.parcel from N
+                    join parceltags as PT on PT.tag=N.tag
+                    where N.node<>''
+                    group by N.node collate nocase, PT.parcel
+                )
+            select D.node, A.currency, count(*), sum(P.amount) from D
+            join parcels as P on P.key=D.parcel
+            join transactions as T on T.key=P.trans
+            join accounts as A on A.key=T.account
+            group by D.node collate nocase, A.currency
+            order by D.node collate nocase, A.currency""")
+
+
+    def tag_totals(self, acckeys=None, datemin=None, datemax=None):
+        """Return the number, total and average amount of the parcels of each
+           tag, by currency, as (tag name, currency name, number, total,
+           average) tuples ordered by tag name and currency.
+        """
+        conds, params = [], []
+        if acckeys:
+            conds.append(f"T.account in ({','.join('?' * len(acckeys))})")
+            params.extend(acckeys)
+        if datemin:
+            conds.append("T.date>=?")
+            params.append(datemin)
+        if datemax:
+            conds.append("T.date<=?")
+            params.append(datemax)
+        cond = f"where {' and '.join(conds)}" if conds else ''
+
+        return self._qry("select TG.name, A.currency, count(*), sum(P.amount), "
+                         "       cast(round(avg(P.amount)) as integer) "
+                         "from parceltags as PT "
+                         "join tags as TG on TG.key=PT.tag "
+                         "join parcels as P on P.key=PT.parcel "
+                         "join transactions as T on T.key=P.trans "
+                         f"join accounts as A on A.key=T.account {cond} "
+                         "group by PT.tag, A.currency "
+                         "order by TG.name, A.currency", tuple(params))
+
+
+    def monthly_by_account(self, acckeys=None, monthmin=None, monthmax=None):
+        """Return the monthly inflow, outflow and number of transactions of
+           accounts, as (month, account name, currency name, inflow, outflow,
+           count) tuples ordered by month and account name.
+           Months are given as 'YYYY-MM' strings.
+        """
+        conds, params = [], []
+        if acckeys:
+            conds.append(f"M.account in ({','.join('?' * len(acckeys))})")
+            params.extend(acckeys)
+        if monthmin:
+            conds.append("M.month>=?")
+            params.append(monthmin)
+        if monthmax:
+            conds.append("M.month<=?")
+            params.append(monthmax)
+        cond = f"where {' and '.join(conds)}" if conds else ''
+
+        return self._qry("select M.month, A.name, A.currency, "
+                         "       M.inflow, M.outflow, M.count "
+                         "from monthly_accounts as M "
+                         f"join accounts as A on A.key=M.account {cond} "
+                         "order by M.month, A.name", tuple(params))
+
+
+    def monthly_by_tag(self, tags=None, monthmin=None, monthmax=None):
+        """Return the monthly inflow, outflow and number of parcels of tags,
+           by currency, as (month, tag name, currency name, inflow, outflow,
+           count) tuples ordered by month, tag name and currency.
+           Months are given as 'YYYY-MM' strings.
+        """
+        conds, params = [], []
+        if tags:
+            tagcond, params = self._tags_filter(tags)
+            conds.append(f"M.tag in ({tagcond})")
+            params = list(params)
+        if monthmin:
+            conds.append("M.month>=?")
+            params.append(monthmin)
+        if monthmax:
+            conds.append("M.month<=?")
+            params.append(monthmax)
+        cond = f"where {' and '.join(conds)}" if conds else ''
+
+        return self._qry("select M.month, T.name, M.currency, "
+                         "       M.inflow, M.outflow, M.count "
+                         "from monthly_tags as M "
+                         f"join tags as T on T.key=M.tag {cond} "
+                         "order by M.month, T.name, M.currency", tuple(params))
 
 
     def tags_by_parcel(self, parcel):
         """Return list of tags by parcel.
         """
         return [t[0]
-                for t in self._qry("select tag from parceltags where parcel=?",
+                for t in self._qry("select T.name from parceltags as PT "
+                                   "join tags as T on T.key=PT.tag "
+                                   "where PT.parcel=? order by T.name",
                                    (parcel,))]
 
 
     def fill_tags(self, parcel_list):
         """Fill tags parameter in a parcel list.
+           Tags are read with one query for each block of parcels.
         """
-        for p in parcel_list:
-            p.tags = self.tags_by_parcel(p.key)
+        parcels = {p.key: p for p in parcel_list}
+        for p in parcels.values():
+            p.tags = []
+
+        keys = list(parcels)
+        for i in range(0, len(keys), _BLOCK_SIZE):
+            block = keys[i:i+_BLOCK_SIZE]
+            for parcel, tag in self._qry("select PT.parcel, T.name "
+                                         "from parceltags as PT "
+                                         "join tags as T on T.key=PT.tag "
+                                         "where PT.parcel in "
+                                         f"({','.join('?' * len(block))}) "
+                                         "order by PT.parcel, T.name", block):
+                parcels[parcel].tags.append(tag)
 
 
 #-----------------------------------------------------------------------------
@@ -810,3 +1335,467 @@ begin
     delete from parceltags where parcel=old.key;
 end;
 """
+
+
+# Number of nodes in the balance tree of an account: julian day numbers up to
+# this size cover dates up to the 67th century.
+_TREE_SIZE = 2 ** 22
+
+
+def _key(key):
+    """Return a record key as an integer, or None if it isn't a valid key.
+    """
+    return int(key) if str(key).isdecimal() else None
+
+
+def _like(pattern):
+    """Return a function that matches strings against a SQL 'like' pattern:
+       case insensitive, with '%' and '_' as wildcards.
+    """
+    regex = ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c)
+                    for c in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL).fullmatch
+
+
+# Maximum number of parameters in a SQL 'in' list.
+_BLOCK_SIZE = 500
+
+
+def _julian_day(date):
+    """Return the julian day number of an ISO date string, as given by
+       the SQLite expression 'cast(julianday(date) as integer)'.
+    """
+    return datetime.date.fromisoformat(date).toordinal() + 1721424
+
+
+#-----------------------------------------------------------------------------
+# SQL scripts to upgrade the storage schema.
+# Item N of the list upgrades a storage file from version N to version N+1.
+
+_MIGRATIONS = [
+# version 1: indexes for account/date, transaction and tag lookups
+"""
+create index transactions_account on transactions(account, date, key);
+create index transactions_date on transactions(date, key);
+create index parcels_trans on parcels(trans);
+create index parceltags_tag on parceltags(tag, parcel);
+""",
+
+# version 2: account balances kept in a balance tree instead of the running
+#            balance of every transaction
+f"""
+create table balancetree (
+    account     integer not null,
+    node        integer not null,
+    amount      integer not null,
+    primary key (account, node),
+    foreign key (account) references accounts(key)
+) without rowid;
+
+insert into balancetree
+    with recursive
+        -- the balance change of each transaction also includes the balance
+        -- carried over from trimmed transactions
+        D(account, node, amount) as (
+            select account, cast(julianday(date) as integer),
+                   accbalance - coalesce(lag(accbalance) over
+                                (partition by account order by date, key), 0)
+            from transactions
+        ),
+        N(account, node, amount) as (
+            select * from D
+            union all
+            select account, node + (node & -node), amount from N
+            where node + (node & -node) <= {_TREE_SIZE}
+        )
+    select account, node, sum(amount) from N group by account, node;
+
+update accounts set balance=0 where balance is null;
+
+alter table transactions drop column accbalance;
+
+create trigger del_account_balance before delete on accounts
+begin
+    delete from balancetree where account=old.key;
+end;
+""",
+
+# version 3: full-text indexes of transaction and parcel descriptions
+"""
+create virtual table transactions_fts using fts5(
+    descr, content='transactions', content_rowid='key',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+create virtual table parcels_fts using fts5(
+    descr, content='parcels', content_rowid='key',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+insert into transactions_fts(transactions_fts) values('rebuild');
+insert into parcels_fts(parcels_fts) values('rebuild');
+
+create trigger ins_transaction_fts after insert on transactions
+begin
+    insert into transactions_fts(rowid, descr) values(new.key, new.descr);
+end;
+
+create trigger del_transaction_fts after delete on transactions
+begin
+    insert into transactions_fts(transactions_fts, rowid, descr)
+        values('delete', old.key, old.descr);
+end;
+
+create trigger upd_transaction_fts after update of descr on transactions
+begin
+    insert into transactions_fts(transactions_fts, rowid, descr)
+        values('delete', old.key, old.descr);
+    insert into transactions_fts(rowid, descr) values(new.key, new.descr);
+end;
+
+create trigger ins_parcel_fts after insert on parcels
+begin
+    insert into parcels_fts(rowid, descr) values(new.key, new.descr);
+end;
+
+create trigger del_parcel_fts after delete on parcels
+begin
+    insert into parcels_fts(parcels_fts, rowid, descr)
+        values('delete', old.key, old.descr);
+end;
+
+create trigger upd_parcel_fts after update of descr on parcels
+begin
+    insert into parcels_fts(parcels_fts, rowid, descr)
+        values('delete', old.key, old.descr);
+    insert into parcels_fts(rowid, descr) values(new.key, new.descr);
+end;
+""",
+
+# version 4: tag names kept in a dictionary table, with the number of
+#            parcels of each tag, and parcel tags referring to it by key;
+#            tags differing only in case are merged
+"""
+create table tags (
+    key         integer,
+    name        text not null collate nocase,
+    counter     integer not null default 0,
+    primary key (key)
+);
+
+create unique index tags_name on tags(name);
+
+insert into tags(name) select min(tag) from parceltags group by tag collate nocase;
+
+drop trigger del_parcel;
+alter table parceltags rename to parceltags_old;
+
+create table parceltags (
+    parcel      integer not null,
+    tag         integer not null,
+    primary key (parcel, tag),
+    foreign key (parcel) references parcels(key),
+    foreign key (tag) references tags(key)
+) without rowid;
+
+insert or ignore into parceltags
+    select PT.parcel, T.key from parceltags_old as PT
+    join tags as T on T.name=PT.tag;
+
+drop table parceltags_old;
+
+create index parceltags_tag on parceltags(tag, parcel);
+
+update tags set counter=(select count(*) from parceltags where tag=tags.key);
+
+create trigger del_parcel after delete on parcels
+begin
+    delete from parceltags where parcel=old.key;
+end;
+
+create trigger ins_parceltag after insert on parceltags
+begin
+    update tags set counter=counter+1 where key=new.tag;
+end;
+
+create trigger del_parceltag after delete on parceltags
+begin
+    update tags set counter=counter-1 where key=old.tag;
+    delete from tags where key=old.tag and counter=0;
+end;
+""",
+
+# version 5: monthly inflow, outflow and number of transactions per account,
+#            and of parcels per tag and currency, kept up to date by triggers
+"""
+create table monthly_accounts (
+    account     integer not null,
+    month       text not null,
+    inflow      integer not null,
+    outflow     integer not null,
+    count       integer not null,
+    primary key (account, month),
+    foreign key (account) references accounts(key)
+) without rowid;
+
+create table monthly_tags (
+    tag         integer not null,
+    currency    text not null,
+    month       text not null,
+    inflow      integer not null,
+    outflow     integer not null,
+    count       integer not null,
+    primary key (tag, currency, month),
+    foreign key (tag) references tags(key),
+    foreign key (currency) references currencies(name)
+) without rowid;
+
+insert into monthly_accounts
+    select account, substr(date, 1, 7),
+           sum(max(amount, 0)), sum(min(amount, 0)), count(*)
+    from transactions group by 1, 2;
+
+insert into monthly_tags
+    select PT.tag, A.currency, substr(T.date, 1, 7),
+           sum(max(P.amount, 0)), sum(min(P.amount, 0)), count(*)
+    from parceltags as PT
+    join parcels as P on P.key=PT.parcel
+    join transactions as T on T.key=P.trans
+    join accounts as A on A.key=T.account
+    group by 1, 2, 3;
+
+-- accounts
+
+create trigger ins_transaction_monthly after insert on transactions
+begin
+    insert into monthly_accounts
+        values(new.account, substr(new.date, 1, 7),
+               max(new.amount, 0), min(new.amount, 0), 1)
+        on conflict do update set inflow=inflow+excluded.inflow,
+                                  outflow=outflow+excluded.outflow,
+                                  count=count+1;
+end;
+
+create trigger del_transaction_monthly after delete on transactions
+begin
+    update monthly_accounts set inflow=inflow-max(old.amount, 0),
+                                outflow=outflow-min(old.amount, 0),
+                                count=count-1
+        where account=old.account and month=substr(old.date, 1, 7);
+    delete from monthly_accounts
+        where account=old.account and month=substr(old.date, 1, 7)
+              and count=0;
+end;
+
+create trigger upd_transaction_monthly
+after update of account, date, amount on transactions
+begin
+    update monthly_accounts set inflow=inflow-max(old.amount, 0),
+                                outflow=outflow-min(old.amount, 0),
+                                count=count-1
+        where account=old.account and month=substr(old.date, 1, 7);
+    insert into monthly_accounts
+        values(new.account, substr(new.date, 1, 7),
+               max(new.amount, 0), min(new.amount, 0), 1)
+        on conflict do update set inflow=inflow+excluded.inflow,
+                                  outflow=outflow+excluded.outflow,
+                                  count=count+1;
+    delete from monthly_accounts
+        where account=old.account and month=substr(old.date, 1, 7)
+              and count=0;
+end;
+
+-- tags: parcels being deleted are removed before their tags, while the
+-- amount and date of the parcel are still available
+
+create trigger ins_parceltag_monthly after insert on parceltags
+begin
+    insert into monthly_tags
+        select new.tag, A.currency, substr(T.date, 1, 7),
+               max(P.amount, 0), min(P.amount, 0), 1
+        from parcels as P
+        join transactions as T on T.key=P.trans
+        join accounts as A on A.key=T.account
+        where P.key=new.parcel
+        on conflict do update set inflow=inflow+excluded.inflow,
+                                  outflow=outflow+excluded.outflow,
+                                  count=count+1;
+end;
+
+create trigger del_parceltag_monthly after delete on parceltags
+when exists (select 1 from parcels where key=old.parcel)
+begin
+    update monthly_tags set inflow=inflow-max(X.amount, 0),
+                            outflow=outflow-min(X.amount, 0),
+                            count=count-1
+        from (select P.amount, A.currency, substr(T.date, 1, 7) as month
+              from parcels as P
+              join transactions as T on T.key=P.trans
+              join accounts as A on A.key=T.account
+              where P.key=old.parcel) as X
+        where tag=old.tag and monthly_tags.currency=X.currency
+              and monthly_tags.month=X.month;
+    delete from monthly_tags where tag=old.tag and count=0;
+end;
+
+create trigger del_parcel_monthly before delete on parcels
+begin
+    update monthly_tags set inflow=inflow-max(old.amount, 0),
+                            outflow=outflow-min(old.amount, 0),
+                            count=count-1
+        from (select A.currency, substr(T.date, 1, 7) as month
+              from transactions as T
+              join accounts as A on A.key=T.account
+              where T.key=old.trans) as X
+        where monthly_tags.currency=X.currency and monthly_tags.month=X.month
+              and tag in (select tag from parceltags where parcel=old.key);
+    delete from monthly_tags
+        where count=0 and tag in (select tag from parceltags
+                                  where parcel=old.key);
+end;
+
+create trigger upd_parcel_monthly after update of amount on parcels
+begin
+    update monthly_tags
+        set inflow=inflow-max(old.amount, 0)+max(new.amount, 0),
+            outflow=outflow-min(old.amount, 0)+min(new.amount, 0)
+        from (select A.currency, substr(T.date, 1, 7) as month
+              from transactions as T
+              join accounts as A on A.key=T.account
+              where T.key=new.trans) as X
+        where monthly_tags.currency=X.currency and monthly_tags.month=X.month
+              and tag in (select tag from parceltags where parcel=new.key);
+end;
+
+create trigger upd_transaction_tags_monthly
+after update of account, date on transactions
+when substr(old.date, 1, 7) <> substr(new.date, 1, 7)
+     or old.account <> new.account
+begin
+    update monthly_tags set inflow=monthly_tags.inflow-X.inflow,
+                            outflow=monthly_tags.outflow-X.outflow,
+                            count=monthly_tags.count-X.count
+        from (select PT.tag, A.currency,
+                     sum(max(P.amount, 0)) as inflow,
+                     sum(min(P.amount, 0)) as outflow, count(*) as count
+              from parcels as P
+              join parceltags as PT on PT.parcel=P.key
+              join accounts as A on A.key=old.account
+              where P.trans=old.key group by 1, 2) as X
+        where monthly_tags.tag=X.tag and monthly_tags.currency=X.currency
+              and month=substr(old.date, 1, 7);
+    insert into monthly_tags
+        select PT.tag, A.currency, substr(new.date, 1, 7),
+               sum(max(P.amount, 0)), sum(min(P.amount, 0)), count(*)
+        from parcels as P
+        join parceltags as PT on PT.parcel=P.key
+        join accounts as A on A.key=new.account
+        where P.trans=new.key group by 1, 2
+        on conflict do update set inflow=inflow+excluded.inflow,
+                                  outflow=outflow+excluded.outflow,
+                                  count=count+excluded.count;
+    delete from monthly_tags where month=substr(old.date, 1, 7) and count=0;
+end;
+""",
+
+# version 6: optional daily balance snapshots, filled when they are enabled
+"""
+create table dailybalances (
+    account     integer not null,
+    date        text not null,
+    balance     integer not null,
+    primary key (account, date),
+    foreign key (account) references accounts(key)
+) without rowid;
+
+create trigger del_account_snapshots before delete on accounts
+begin
+    delete from dailybalances where account=old.key;
+end;
+""",
+]
+
+
+#-----------------------------------------------------------------------------
+# SQL queries on the balance tree.
+#
+# The balance tree is a Fenwick tree (binary indexed tree) per account, with
+# the days numbered by their julian day number.  Node N holds the sum of the
+# transaction amounts in the days from N-lowbit(N)+1 to N, so changing an
+# amount or querying the balance on a given day touches at most log2 of the
+# tree size nodes.
+
+# Account balance at the end of a day.
+# Format with the account and date SQL expressions.
+_SQL_BALANCE = """(
+    select sum(amount) from balancetree
+    where account={account} and node in (
+        with recursive N(node) as (
+            select cast(julianday({date}) as integer)
+            union all
+            select node - (node & -node) from N where node > (node & -node)
+        )
+        select node from N))"""
+
+# Account balance at the end of a day, read from the daily balance snapshots.
+# Format with the account and date SQL expressions.
+_SQL_SNAPSHOT = """(
+    select balance from dailybalances
+    where account={account} and date<={date} order by date desc limit 1)"""
+
+# Last day of the period of a date, by period.
+# Format with the date SQL expression.
+_SQL_PERIOD_END = {
+    'day': "{}",
+    'week': "date({}, 'weekday 0')",
+    'month': "date({}, 'start of month', '+1 month', '-1 day')",
+}
+
+# Transaction columns, including the account balance after the transaction,
+# to be selected from the transactions table aliased as T.
+# Format with the balance SQL expression of the account at the end of the day.
+_SQL_TRANSACTION = ("T.key, T.account, T.date, T.descr, T.amount, {balance}"
+                    " - (select coalesce(sum(amount), 0) from transactions "
+                    "    where account=T.account and date=T.date and key>T.key)")
+
+# Columns of the transactions, of their parcels and of the tags of their
+# parcels, as (column, source) pairs by name.
+# Format the source with the condition on the transactions table aliased as T.
+_SQL_COLUMNS_TRANS = "from transactions as T {cond} order by T.key"
+_SQL_COLUMNS_PARCELS = ("from parcels as P "
+                        "join transactions as T on T.key=P.trans "
+                        "{cond} order by P.key")
+_SQL_COLUMNS_TAGS = ("from parceltags as PT "
+                     "join parcels as P on P.key=PT.parcel "
+                     "join transactions as T on T.key=P.trans "
+                     "{cond} order by PT.parcel, PT.tag")
+_SQL_COLUMNS = {
+    'trans': ("T.key", _SQL_COLUMNS_TRANS),
+    'account': ("T.account", _SQL_COLUMNS_TRANS),
+    'julianday': ("cast(julianday(T.date) as integer)", _SQL_COLUMNS_TRANS),
+    'amount': ("T.amount", _SQL_COLUMNS_TRANS),
+    'parcel': ("P.key", _SQL_COLUMNS_PARCELS),
+    'parcel_trans': ("P.trans", _SQL_COLUMNS_PARCELS),
+    'parcel_amount': ("P.amount", _SQL_COLUMNS_PARCELS),
+    'tag_parcel': ("PT.parcel", _SQL_COLUMNS_TAGS),
+    'tag': ("PT.tag", _SQL_COLUMNS_TAGS),
+}
+
+
+#-----------------------------------------------------------------------------
+# SQL queries on parcels.
+
+# Separator of the tags concatenated in a single column.
+_TAGSEP = '\x1f'
+
+# Character following the tag hierarchy separator ('/'), the upper bound of
+# the names of the tags below a given one.
+_TAGEND = chr(ord('/') + 1)
+
+# Parcel columns, with the list of tags concatenated in the last one,
+# to be selected from the parcels table aliased as P.
+_SQL_PARCEL = ("P.key, P.trans, P.descr, P.amount, "
+               "(select group_concat(name, char(31)) "
+               " from (select T.name from parceltags as PT "
+               "       join tags as T on T.key=PT.tag "
+               "       where PT.parcel=P.key order by T.name))")
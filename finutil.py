@@ -2,8 +2,8 @@
 Finance Control command line interface utility functions
 """
 
-__version__ = '0.12'
-__date__ ='2024-07-31'
+__version__ = '0.13'
+__date__ = '2026-10-18'
 __author__ = 'António Manuel Dias <ammdias@gmail.com>'
 __license__ = """
 This program is free software: you can redistribute it and/or modify
@@ -21,14 +21,40 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import sys
+import re
 import datetime
-import shutil
 import string   # for string.whitespace and string.digits
 
+# Modules used only by some commands (shutil, json, time, csv, gzip, lzma) are
+# imported by the functions that need them, to keep the program start fast.
+
+
+# Number of error messages displayed
+errors = 0
+
+# Output format of the batch mode ('tsv' or 'jsonl'), or None when results
+# are displayed on the terminal
+batch = None
+
+# Whether long listings are split by pages, waiting for the user between them,
+# and their lines cut at the terminal width
+paging = True
+
+# Number of rows read at a time when writing tables in batch mode or without
+# pages
+_BATCH_PAGE = 1000
+
 
 def yesno(question):
     """Get a yes or no answer to a question.
+       In batch mode there is no one to ask, so the answer is no and an error
+       is reported.
     """
+    if batch:
+        error(f"confirmation needed, not available in batch mode:\n"
+              f"    {question}")
+        return False
+
     answer = ''
     while answer not in ('y', 'yes', 'n', 'no'):
         try:
@@ -106,50 +132,123 @@ def parse_tags(tags):
     return [t.strip() for t in tags.split(',')] if tags.strip() else []
 
 
+class CurrencyFormat:
+    """Formatter and parser of the amounts of a currency, given in the units
+       of its smallest fraction.  The format template, the fraction unit and
+       the number pattern are prepared once, when the object is created.
+    """
+
+    def __init__(self, curr):
+        """Prepare format and parser for the currency settings.
+        """
+        def escape(s):
+            return s.replace('{', '{{').replace('}', '}}')
+
+        number = f"{{}}{{}}{escape(curr.dec_sep)}{{:0{curr.dec_places}}}"
+        symbol = escape(curr.symbol)
+        self._template = (f"{symbol} {number}" if curr.symbol_pos == 'left'
+                          else f"{number} {symbol}").format
+        self._unit = 10 ** curr.dec_places
+        self._places = curr.dec_places
+        self._sep = curr.dec_sep
+        self._strip = curr.symbol + string.whitespace
+        # optional sign, digits and a single decimal separator
+        self._valid = re.compile(
+                f"[-+]?[0-9]*(?:{re.escape(curr.dec_sep)}[0-9]*)?").fullmatch
+
+
+    def format(self, value):
+        """Return string representation of integer value.
+        """
+        return self._template('-' if value < 0 else '',
+                              *divmod(abs(value), self._unit))
+
+
+    def format_many(self, values):
+        """Return list of string representations of integer values.
+        """
+        template, unit = self._template, self._unit
+        return [template('-' if v < 0 else '', *divmod(abs(v), unit))
+                for v in values]
+
+
+    def parse(self, value):
+        """Convert string representation of amount to integer value, avoiding
+           float binary representation errors.
+        """
+        # remove currency symbol and whitespace from start/end of value
+        value = value.strip(self._strip)
+        if not value or not self._valid(value):
+            raise ValueError('Invalid number.')
+
+        ival, _, dval = value.partition(self._sep)
+        return int(ival + dval.ljust(self._places, '0')[:self._places])
+
+
+    def parse_many(self, values):
+        """Convert list of string representations of amounts to integer
+           values.
+        """
+        return [self.parse(v) for v in values]
+
+
+# Currency formats by currency settings
+_formats = {}
+
+
+class _NoCurrency:
+    """Settings used for amounts without a currency: those of a new currency.
+    """
+    symbol, symbol_pos, dec_places, dec_sep = '', 'left', 2, '.'
+
+
+def currency_format(curr):
+    """Return the CurrencyFormat of a currency, created once for each set of
+       currency settings.  Without a currency (None), the default settings
+       are used.
+    """
+    if curr is None:
+        curr = _NoCurrency
+    key = (curr.symbol, curr.symbol_pos, curr.dec_places, curr.dec_sep)
+    fmt = _formats.get(key)
+    if fmt is None:
+        fmt = _formats[key] = CurrencyFormat(curr)
+
+    return fmt
+
+
 def i2d(value, curr): 
     """Returns string representation of integer value according to currency
        decimal places.
     """ 
-    result = '{c} {v}' if curr.symbol_pos == 'left' else '{v} {c}'
-    sign = '-' if value < 0 else '' 
-    ival, dval = divmod(abs(value), 10 ** curr.dec_places)
-    value = f"{sign}{ival}{curr.dec_sep}{dval:0{curr.dec_places}}"
-
-    return result.format(c=curr.symbol, v=value)
+    return currency_format(curr).format(value)
 
 
 def d2i(value, curr):
     """Converts float string representation of currency to number with no
        decimal places, avoiding float binary representation errors.
     """
-    def valid_number(s):
-        valid_digits = string.digits + curr.dec_sep
-        for c in (s[1:] if s[0] in '-+' else s):
-            if c not in valid_digits:
-                return False
-
-        if value.count(curr.dec_sep) > 1: # no multiple decimal separators
-            return False
+    return currency_format(curr).parse(value)
 
-        return True
 
-    # remove currency symbol and whitespace from start/end of value
-    value = value.strip(curr.symbol + string.whitespace)
-
-    if not value or not valid_number(value):
-        raise ValueError('Invalid number.')
-
-    ival, _, dval = value.partition(curr.dec_sep)
-    return int(ival + dval.ljust(curr.dec_places, '0')[:curr.dec_places])
-
-
-def print_table(data, headers=[], hints=None):
+def print_table(data, headers=[], hints=None, fetch=None, count=0):
     """Print a table on screen.
+       Instead of the data, a function fetch(page, size) returning the rows
+       of a page may be given, with the total count of rows.  Rows are then
+       read only when their page is shown and the column widths are set for
+       each page.
+       In batch mode rows are written to the standard output instead.
     """
-    if not data:
+    if batch:
+        if fetch:
+            data = _fetch_all(fetch, count)
+        _write_lines(_batch_rows(data, headers))
+        return
+
+    if not data and not count:
         raise ValueError("Empty set")
 
-    def max_col_sizes(): 
+    def max_col_sizes(data): 
         res = [len(i) for i in headers] if headers else [0] * len(data[0]) 
         for ln in data: 
             for i,cell in enumerate(ln): 
@@ -159,49 +258,97 @@ def print_table(data, headers=[], hints=None):
 
     colsep = ' | '
     headsep, headcolsep = '-', '-+-'
-    sizes = max_col_sizes()
-    hints = hints if hints else '<' * len(sizes)
-
-    pageheader = []
-    if headers:
-        headln = []
-        for idx,col in enumerate(headers):
-            headers[idx] = f"{col:<{sizes[idx]}s}"
-            headln.append(headsep * sizes[idx])
-        pageheader = [colsep.join(headers), headcolsep.join(headln)]
-
-    pagedata = []
-    for row in data:
-        pagedata.append(colsep.join([f"{col:{hints[idx]}{sizes[idx]}s}"
-                                     for idx,col in enumerate(row)]))
+
+    def format_rows(data):
+        sizes = max_col_sizes(data)
+        align = hints if hints else '<' * len(sizes)
+
+        pageheader = []
+        if headers:
+            headln = [headsep * size for size in sizes]
+            pageheader = [colsep.join([f"{col:<{sizes[idx]}s}"
+                                       for idx,col in enumerate(headers)]),
+                          headcolsep.join(headln)]
+
+        pagedata = []
+        for row in data:
+            pagedata.append(colsep.join([f"{col:{align[idx]}{sizes[idx]}s}"
+                                         for idx,col in enumerate(row)]))
+        return pageheader, pagedata
+
     print()
-    paginate(pageheader, pagedata)
+    if fetch:
+        paginate(['', ''] if headers else [],
+                 fetch=lambda page, size: format_rows(fetch(page, size)),
+                 count=count)
+    else:
+        paginate(*format_rows(data))
     
 
-def paginate(header=[], data=[]):
+def print_fields(fields):
+    """Print the fields of a record, given as a list of (name, value) pairs,
+       one per line.
+       In batch mode the record is written as a table row instead, with the
+       field names as headers.
+    """
+    if batch:
+        print_table([[str(v) for _, v in fields]], [n for n, _ in fields])
+    else:
+        paginate(data=[f"{n}: {v}" for n, v in fields])
+
+
+def paginate(header=[], data=[], fetch=None, count=0):
     """Print data split by pages accounting for screen size.
+       Instead of the data, a function fetch(page, size) returning the header
+       and data lines of a page may be given, with the total count of lines;
+       the header given then sets only the number of header lines.
+       In batch mode lines are written to the standard output instead, as
+       they are or, in the jsonl format, as objects with a single `Text' key.
+       Without paging all lines are printed at once and not cut.
     """
+    if batch:
+        import json
+
+        if fetch:
+            header, data = [], _fetch_all(lambda p, s: fetch(p, s)[1], count)
+        _write_lines(json.dumps({'Text': line}, ensure_ascii=False)
+                     if batch == 'jsonl' else line
+                     for line in (*header, *data))
+        return
+
+    import shutil
+
     footer = "Page {} of {}. (N)ext / (P)revious / Page number / (Q)uit ? "
     term_width, term_height = shutil.get_terminal_size()
     page_size = term_height - len(header) - 2 # 2: len of footer
+    if not fetch:
+        count = len(data)
 
     def println(line):
-        if len(line) < term_width:
+        if not paging or len(line) < term_width:
             print(line)
         else:
             print(line[:term_width - 4] + ' ...')
 
     def print_page(page_num):
-        for i in header:
+        if fetch:
+            lines = fetch(page_num, page_size)
+        else:
+            lines = header, data[page_num*page_size:(page_num+1)*page_size]
+        for i in lines[0]:
             println(i)
-        for i in data[page_num*page_size:(page_num+1)*page_size]:
+        for i in lines[1]:
             println(i)
         print()
 
-    if len(data) <= page_size:
+    if not paging:
+        page_size = _BATCH_PAGE if fetch else max(count, 1)
+        for page in range((count + page_size - 1) // page_size or 1):
+            print_page(page)
+    elif count <= page_size:
         print_page(0)
     else:
-        pages = len(data) // page_size + (len(data) % page_size != 0)
+        pages = count // page_size + (count % page_size != 0)
         page, cmd = 0, ''
         while cmd not in ('q', 'quit'):
             print_page(page)
@@ -225,19 +372,85 @@ def paginate(header=[], data=[]):
 
 def export(filepath, csvsep, data, headers=[]):
     """Export data to CSV file.
+       Data may be any iterable of rows, which are written as they are read.
+       Files ending in '.gz' or '.xz' are compressed.  Exports taking more
+       than a second display their progress on the error stream, except in
+       batch mode.
     """
+    import time
+    import csv
+    import gzip
+    import lzma
+
+    if filepath.endswith('.gz'):
+        opener = gzip.open
+    elif filepath.endswith('.xz'):
+        opener = lzma.open
+    else:
+        opener = open
+
+    rows, start = 0, time.monotonic()
+    report = start + 1
     try:
-        with open(filepath, 'w') as f:
+        with opener(filepath, 'wt', newline='') as f:
+            writer = csv.writer(f, delimiter=csvsep, lineterminator='\n')
             if headers:
-                print(csvsep.join(headers), file=f)
+                writer.writerow(headers)
             for row in data:
-                print(csvsep.join(row), file=f)
+                writer.writerow(row)
+                rows += 1
+                if (rows % 1000 == 0 and not batch
+                        and time.monotonic() >= report):
+                    report = time.monotonic()
+                    print(f"\r{rows} rows exported "
+                          f"({rows / (report - start):.0f} rows/s)",
+                          end='', flush=True, file=sys.stderr)
+                    report += 1
     except Exception as e:
         raise Exception(f"unable to write to file. Reason:\n    {e}")
+    finally:
+        if report > start + 1:
+            print(file=sys.stderr)
+
+
+def _fetch_all(fetch, count):
+    """Return iterator over all the rows read by function fetch(page, size),
+       given their total count.
+    """
+    for page in range((count + _BATCH_PAGE - 1) // _BATCH_PAGE):
+        yield from fetch(page, _BATCH_PAGE)
+
+
+def _batch_rows(data, headers):
+    """Return iterator over table rows as lines in the batch mode format:
+       tab separated values, with a header line, or JSON objects with the
+       headers as keys.
+    """
+    if batch == 'jsonl':
+        import json
+
+        for row in data:
+            row = [c.strip() for c in row]
+            yield json.dumps(dict(zip(headers, row)) if headers else row,
+                             ensure_ascii=False)
+    else:
+        if headers:
+            yield '\t'.join(headers)
+        for row in data:
+            yield '\t'.join(c.strip().replace('\t', ' ').replace('\n', ' ')
+                            for c in row)
+
+
+def _write_lines(lines):
+    """Write lines to the standard output.
+    """
+    sys.stdout.writelines(f"{line}\n" for line in lines)
 
 
 def error(msg):
     """Display error message.
     """
+    global errors
+    errors += 1
     print(f'*** Error: {msg}\n', file=sys.stderr)
 
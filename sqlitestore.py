@@ -22,25 +22,33 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os.path
 import sqlite3
+import contextlib
 
 #-----------------------------------------------------------------------------
 class SQLiteStore:
     """Base storage class to ease the use of sqlite3 databases
     """
 
-    def __init__(self, storepath, create=False, **metadata):
+    def __init__(self, storepath, create=False, readonly=False, **metadata):
         """Connect to database creating it if required and necessary.
 
         storepath: path to sqlite3 storage file
         create: set to True to create database on non-existing path
+        readonly: set to True to refuse any change to the database
         metadata: key-value pairs of meta data to set in database
         """
         self._db = None
+        self._level = 0             # nesting level of transaction blocks
+        self._data_version = None   # last seen 'pragma data_version' value
+        self._metadata = None       # cache of metadata table
+        self._readonly = readonly
         self._dbpath = storepath.strip()
         if not self._dbpath:
             raise ValueError("Path to the storage not provided.")
         if not create and not os.path.exists(self._dbpath):
             raise ValueError(f"Could not open storage file at '{self._dbpath}'")
+        if readonly and (create or metadata):
+            raise ValueError("A read-only storage can't be created or changed.")
 
         try:
             self._db = sqlite3.connect(self._dbpath)
@@ -61,13 +69,25 @@ class SQLiteStore:
                 for key, value in metadata.items():
                     self.set_metadata(key, value)
 
+        self._set_pragmas(PROFILES.get(self.profile(), PROFILES['safe']))
+        if readonly:
+            self._exec("pragma query_only=1")
+
 
     def __del__(self):
         """Ensure database is in good state before destroying object.
         """
+        self.close()
+
+
+    def close(self):
+        """Commit pending changes and close the connection to the database.
+           Connections may only be closed by the thread that opened them.
+        """
         if self._db:
             self._db.commit()
             self._db.close()
+            self._db = None
 
 
     def backup(self, backuppath, progress=None):
@@ -84,24 +104,106 @@ class SQLiteStore:
         """Insert/update metadata value with given key.
            If key does not exist in metadata table, insert it.
         """
-        if self._exists("metadata", "key", key):
-            self._do("update metadata set value=? where key=?", (value, key))
-        else:
-            self._do("insert into metadata values (?,?)", (key, value))
+        self._do("insert into metadata values (?,?) "
+                 "on conflict(key) do update set value=excluded.value",
+                 (key, value))
+        if self._metadata is not None:
+            self._metadata[key] = value
 
 
     def metadata(self, key):
         """Return metadata value by key if it exists or None.
+           Values are read from the metadata table loaded in memory, which is
+           reloaded when the database is changed by another connection.
         """
-        if not self._exists("metadata", "key", key):
-            return None
-        return self._qry1("select value from metadata where key=?", (key,))[0]
+        self._sync()
+        if self._metadata is None:
+            self._metadata = dict(self._qry("select key, value from metadata"))
+        return self._metadata.get(key)
 
 
     def remove_metadata(self, key):
         """Remove metadata tuple with given key, if it exists.
         """
         self._do("delete from metadata where key=?", (key,))
+        if self._metadata is not None:
+            self._metadata.pop(key, None)
+
+
+    def profile(self):
+        """Return the name of the connection profile of the database.
+        """
+        return self.metadata('storage_profile') or 'safe'
+
+
+    def set_profile(self, name):
+        """Set the connection profile and save it in the metadata.
+        """
+        if name not in PROFILES:
+            raise ValueError(f"Unknown storage profile: {name}")
+
+        self._set_pragmas(PROFILES[name])
+        self.set_metadata('storage_profile', name)
+
+
+    def storage_info(self):
+        """Return list of (pragma, value) pairs with the effective values of
+           the connection settings.
+        """
+        info = []
+        for pragma in ('journal_mode', 'synchronous', 'cache_size',
+                       'mmap_size', 'temp_store', 'page_size', 'page_count'):
+            value = self._qry1(f"pragma {pragma}")[0]
+            if pragma in _PRAGMA_NAMES:
+                value = _PRAGMA_NAMES[pragma][value]
+            info.append((pragma, value))
+
+        return info
+
+
+    def _set_pragmas(self, pragmas):
+        """Set connection pragmas from a dictionary of pragma values.
+           Pragma names and values MUST be checked by the calling code.
+        """
+        for pragma, value in pragmas.items():
+            self._exec(f"pragma {pragma}={value}")
+
+
+    @contextlib.contextmanager
+    def atomic(self):
+        """Run a block of operations in a single database transaction.
+           Nested blocks are part of the outermost one, which commits all
+           changes at its end or rolls them back on error.
+        """
+        self._level += 1
+        try:
+            yield
+            if self._level == 1:
+                self._commit()
+        except:
+            if self._level == 1:
+                self._rollback()
+                self._invalidate()
+            raise
+        finally:
+            self._level -= 1
+
+
+    def _sync(self):
+        """Discard cached data if the database was changed by another
+           connection since the last check.
+        """
+        version = self._qry1("pragma data_version")[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._invalidate()
+
+
+    def _invalidate(self):
+        """Discard data cached from the database.
+           Subclasses keeping caches must extend this method.
+        """
+        self._metadata = None
 
 
     # SQLiteStore access functions
@@ -109,13 +211,13 @@ class SQLiteStore:
     def _do(self, *qry):
         """Execute the query and commit changes.
         """
-        with self._db:
+        with self.atomic():
             return self._exec(*qry)
 
     def _domany(self, *qry):
         """Execute the query for the sequence and commit changes.
         """
-        with self._db:
+        with self.atomic():
             self._exmany(*qry)
 
     def _qry(self, *qry):
@@ -136,6 +238,44 @@ class SQLiteStore:
                          (value,))[0] > 0
 
 
+# -----------------------------------------------------------------------------
+# Connection profiles: pragmas set on the database connection.
+# The profile of a database is saved in its 'storage_profile' metadata.
+
+PROFILES = {
+    # SQLite defaults: rollback journal and full synchronization on commits
+    'safe': {
+        'journal_mode': 'delete',
+        'synchronous': 'full',
+        'cache_size': -2000,            # KiB
+        'mmap_size': 0,
+        'temp_store': 'default',
+    },
+    # write-ahead log, synchronized only on checkpoints, larger caches
+    'balanced': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+    },
+    # no synchronization: a power failure may lose the last transactions
+    'bulk-load': {
+        'journal_mode': 'wal',
+        'synchronous': 'off',
+        'cache_size': -262144,
+        'mmap_size': 1073741824,
+        'temp_store': 'memory',
+    },
+}
+
+# Names of the values of enumerated pragmas
+_PRAGMA_NAMES = {
+    'synchronous': ('off', 'normal', 'full', 'extra'),
+    'temp_store': ('default', 'file', 'memory'),
+}
+
+
 # -----------------------------------------------------------------------------
 # SQL script to create metada table
 
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""
+Finance Control balance snapshots test
+
+Applies the same random changes to two storage files, one with daily balance
+snapshots and one without, and checks that the balances of their accounts
+agree on every day, before, on and between the days of the snapshots.
+Run with:
+    python3 -m unittest test_snapshots
+"""
+
+__version__ = '0.13'
+__date__ = '2026-10-18'
+__author__ = 'António Manuel Dias <ammdias@gmail.com>'
+__license__ = """
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os.path
+import random
+import datetime
+import tempfile
+import unittest
+
+from finstore import FinStore
+
+
+# first and last days of the transactions
+FIRST = datetime.date(2024, 1, 1)
+LAST = datetime.date(2024, 12, 31)
+
+
+#------------------------------------------------------------------------------
+class SnapshotsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.random = random.Random(1)
+        self.stores = []
+        for name in ('tree', 'snapshots'):
+            store = FinStore(os.path.join(self.tmpdir.name, f"{name}.fin"),
+                             True)
+            for acc in ('a', 'b'):
+                a = FinStore.Account()
+                a.name, a.currency = acc, 'default'
+                store.add_account(a)
+            self.stores.append(store)
+        self.tree, self.snap = self.stores
+
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        self.tmpdir.cleanup()
+
+
+    def change(self, count):
+        """Apply the same random changes to both stores.
+        """
+        for _ in range(count):
+            keys = [t.key for t in self.tree.transactions()]
+            op = self.random.random()
+            date = self.date()
+            amount = self.random.randint(-1000, 1000)
+            acckey = self.random.randint(1, 2)
+            key = self.random.choice(keys) if keys else None
+            for store in self.stores:
+                if op < 0.6 or not keys:
+                    t = FinStore.Transaction()
+                    t.account, t.date, t.descr = acckey, date, 'x'
+                    t.parcels = [FinStore.Parcel(None, None, 'x', amount)]
+                    store.add_transaction(t)
+                elif op < 0.7:
+                    store.del_transaction(key)
+                elif op < 0.8:
+                    store.edt_transaction_date(key, date)
+                elif op < 0.9:
+                    store.edt_parcel_amount(store.transaction(key)
+                                                 .parcels[0].key, amount)
+                else:
+                    if store.transaction(key).account != acckey:
+                        store.edt_transaction_account(key, acckey)
+
+
+    def date(self):
+        return (FIRST + datetime.timedelta(
+                    self.random.randint(0, (LAST - FIRST).days))).isoformat()
+
+
+    def assert_balances_agree(self):
+        """Check the balances of both stores on every day from the day before
+           the first transaction to the day after the last one.
+        """
+        self.assertTrue(self.snap.snapshots())
+        self.assertFalse(self.tree.snapshots())
+        day = FIRST - datetime.timedelta(1)
+        while day <= LAST + datetime.timedelta(1):
+            for acckey in (1, 2):
+                date = day.isoformat()
+                self.assertEqual(self.snap.account_balance(acckey, date),
+                                 self.tree.account_balance(acckey, date),
+                                 f"account {acckey} on {date}")
+            day += datetime.timedelta(1)
+
+
+    def test_changes_with_snapshots(self):
+        """Snapshots enabled before the changes are kept up to date.
+        """
+        self.snap.set_snapshots(True)
+        self.change(150)
+        self.assert_balances_agree()
+
+
+    def test_rebuild(self):
+        """Snapshots enabled after changes are rebuilt from the balance tree
+           and kept up to date by the following changes.
+        """
+        self.change(100)
+        self.snap.set_snapshots(True)
+        self.assert_balances_agree()
+        self.change(50)
+        self.assert_balances_agree()
+
+
+    def test_trim(self):
+        """Balances after a trim agree, with snapshots kept through the trim
+           or rebuilt after it.
+        """
+        self.snap.set_snapshots(True)
+        self.change(100)
+        for store in self.stores:
+            store.trim('2024-06-30')
+        self.assert_balances_agree()
+        self.snap.set_snapshots(True)
+        self.assert_balances_agree()
+
+
+if __name__ == '__main__':
+    unittest.main()